@@ -0,0 +1,154 @@
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+from auth import verify_token
+from database import POOL_CAPACITY
+
+# Admission control: keeps heavy report and list traffic from starving checkout.
+#
+# - Checkout routes (PRIORITY_ROUTES) always get in and have
+#   RESERVED_CHECKOUT_CONNECTIONS pool connections kept free for them.
+# - Every other API request takes a slot from the remaining pool capacity and,
+#   for routes in ROUTE_CONCURRENCY_LIMITS, from a per-route limit (503 when full).
+# - Each user has a token bucket of RATE_LIMIT_BURST requests refilled at
+#   RATE_LIMIT_PER_SECOND (429 when empty).
+# Rejections are immediate and carry Retry-After instead of queueing for the pool.
+
+def _parse_limits(value: str) -> dict:
+    limits = {}
+    for part in value.split(","):
+        if "=" in part:
+            route, limit = part.rsplit("=", 1)
+            limits[route.strip()] = int(limit)
+    return limits
+
+PRIORITY_ROUTES = {("POST", "/api/sales"), ("POST", "/api/purchases"), ("POST", "/api/sync/sales")}
+# Long-lived or DB-free routes that should not hold an admission slot
+EXEMPT_ROUTES = {"/api/events", "/api/auth/login"}
+
+RESERVED_CHECKOUT_CONNECTIONS = int(os.getenv("RESERVED_CHECKOUT_CONNECTIONS", "4"))
+ROUTE_CONCURRENCY_LIMITS = _parse_limits(os.getenv(
+    "ROUTE_CONCURRENCY_LIMITS",
+    "/api/reports/inventory=2,/api/reports/dashboard=4,/api/reports/analytics/best-sellers=2,"
+    "/api/reports/analytics/top-customers=2,/api/reports/analytics/supplier-spend=2"
+))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "10"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+MAX_LIST_LIMIT = int(os.getenv("MAX_LIST_LIMIT", "1000"))
+RETRY_AFTER_SECONDS = 1
+
+class AdmissionController:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.general_capacity = max(POOL_CAPACITY - RESERVED_CHECKOUT_CONNECTIONS, 1)
+        self.general_in_flight = 0
+        self.route_in_flight = {route: 0 for route in ROUTE_CONCURRENCY_LIMITS}
+        self.buckets = {}
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "route_busy": 0, "pool_busy": 0, "limit_too_large": 0}
+        self.rejected_by_route = {}
+
+    def _reject(self, reason: str, route: str, status_code: int, detail: str, retry_after: int):
+        with self._lock:
+            self.rejected[reason] += 1
+            self.rejected_by_route[route] = self.rejected_by_route.get(route, 0) + 1
+        return JSONResponse(
+            status_code=status_code,
+            content={"detail": detail},
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    def _take_token(self, key: str) -> float:
+        """Take a token from the user's bucket; returns 0 or the seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self.buckets.get(key, (RATE_LIMIT_BURST, now))
+            tokens = min(RATE_LIMIT_BURST, tokens + (now - updated) * RATE_LIMIT_PER_SECOND)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self.buckets[key] = (tokens, now)
+                wait = (1 - tokens) / RATE_LIMIT_PER_SECOND
+            if len(self.buckets) > 10000:
+                # Buckets idle long enough to be full again carry no state
+                idle = RATE_LIMIT_BURST / RATE_LIMIT_PER_SECOND
+                for k in [k for k, (_, t) in self.buckets.items() if now - t > idle]:
+                    del self.buckets[k]
+        return wait
+
+    def _acquire(self, route: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if self.general_in_flight >= self.general_capacity:
+                return "pool_busy"
+            if route is not None and self.route_in_flight[route] >= ROUTE_CONCURRENCY_LIMITS[route]:
+                return "route_busy"
+            self.general_in_flight += 1
+            if route is not None:
+                self.route_in_flight[route] += 1
+            self.admitted += 1
+        return None
+
+    def _release(self, route: Optional[str]):
+        with self._lock:
+            self.general_in_flight -= 1
+            if route is not None:
+                self.route_in_flight[route] -= 1
+
+    async def __call__(self, request, call_next):
+        path = request.url.path
+        if not path.startswith("/api/") or path in EXEMPT_ROUTES:
+            return await call_next(request)
+        if (request.method, path) in PRIORITY_ROUTES:
+            with self._lock:
+                self.admitted += 1
+            return await call_next(request)
+
+        limit = request.query_params.get("limit")
+        if limit is not None and limit.isdigit() and int(limit) > MAX_LIST_LIMIT:
+            return self._reject("limit_too_large", path, 400, f"limit must not exceed {MAX_LIST_LIMIT}", 0)
+
+        wait = self._take_token(_user_key(request))
+        if wait > 0:
+            return self._reject("rate_limited", path, 429, "Too many requests", math.ceil(wait))
+
+        route = path if path in ROUTE_CONCURRENCY_LIMITS else None
+        reason = self._acquire(route)
+        if reason is not None:
+            return self._reject(reason, path, 503, "Server busy, please retry", RETRY_AFTER_SECONDS)
+        try:
+            return await call_next(request)
+        finally:
+            self._release(route)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "rejected_by_route": dict(self.rejected_by_route),
+                "pool_capacity": POOL_CAPACITY,
+                "reserved_checkout_connections": RESERVED_CHECKOUT_CONNECTIONS,
+                "general_in_flight": self.general_in_flight,
+                "general_capacity": self.general_capacity,
+                "routes": {
+                    route: {"in_flight": self.route_in_flight[route], "limit": limit}
+                    for route, limit in ROUTE_CONCURRENCY_LIMITS.items()
+                },
+                "rate_limit": {"per_second": RATE_LIMIT_PER_SECOND, "burst": RATE_LIMIT_BURST, "users": len(self.buckets)}
+            }
+
+def _user_key(request) -> str:
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        payload = verify_token(authorization[7:])
+        if payload and payload.get("sub"):
+            return f"user:{payload['sub']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+admission = AdmissionController()
@@ -0,0 +1,114 @@
+import threading
+import time
+from datetime import date
+from typing import Callable, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Item, Customer, Supplier, SalesMaster, SalesDetail, PurchaseMaster
+
+# Top-N sales analytics with a result cache keyed by date range.
+# A committed sale or purchase only invalidates the cached ranges that
+# contain its date, so repeated dashboard refreshes reuse the aggregates.
+
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_ENTRIES = 512
+
+class RangeCache:
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = {}
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, source: str, key: tuple, start: Optional[date], end: Optional[date], compute: Callable):
+        """Return the cached result for key, computing it on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["stored_at"] < self.ttl:
+                self.hits += 1
+                return entry["result"]
+            self.misses += 1
+            generation = self._generation.get(source, 0)
+
+        result = compute()
+
+        with self._lock:
+            # Skip the store if a write for this source landed while we were computing
+            if self._generation.get(source, 0) == generation:
+                if len(self._entries) >= self.max_entries:
+                    oldest = min(self._entries, key=lambda k: self._entries[k]["stored_at"])
+                    del self._entries[oldest]
+                self._entries[key] = {
+                    "source": source,
+                    "start": start or date.min,
+                    "end": end or date.max,
+                    "stored_at": time.monotonic(),
+                    "result": result
+                }
+        return result
+
+    def invalidate(self, source: str, day: date):
+        """Drop cached ranges of this source ("sales" or "purchases") that contain day"""
+        with self._lock:
+            self._generation[source] = self._generation.get(source, 0) + 1
+            stale = [k for k, e in self._entries.items()
+                     if e["source"] == source and e["start"] <= day <= e["end"]]
+            for k in stale:
+                del self._entries[k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+analytics_cache = RangeCache()
+
+def _in_range(column, start: Optional[date], end: Optional[date]):
+    criteria = []
+    if start:
+        criteria.append(column >= start)
+    if end:
+        criteria.append(column <= end)
+    return criteria
+
+def best_sellers(db: Session, start: Optional[date] = None, end: Optional[date] = None, limit: int = 10):
+    def compute():
+        quantity = func.sum(SalesDetail.quantity)
+        revenue = func.sum(SalesDetail.quantity * SalesDetail.rate)
+        rows = db.query(SalesDetail.item_id, Item.name, quantity, revenue) \
+            .join(SalesMaster, SalesMaster.id == SalesDetail.sales_id) \
+            .join(Item, Item.id == SalesDetail.item_id) \
+            .filter(*_in_range(SalesMaster.sales_date, start, end)) \
+            .group_by(SalesDetail.item_id, Item.name) \
+            .order_by(quantity.desc()) \
+            .limit(limit).all()
+        return [{"item_id": r[0], "name": r[1], "quantity": float(r[2] or 0), "revenue": float(r[3] or 0)} for r in rows]
+    return analytics_cache.get_or_compute("sales", ("best_sellers", start, end, limit), start, end, compute)
+
+def top_customers(db: Session, start: Optional[date] = None, end: Optional[date] = None, limit: int = 10):
+    def compute():
+        revenue = func.sum(SalesMaster.total_amount)
+        rows = db.query(SalesMaster.customer_id, Customer.name, func.count(SalesMaster.id), revenue) \
+            .join(Customer, Customer.id == SalesMaster.customer_id) \
+            .filter(*_in_range(SalesMaster.sales_date, start, end)) \
+            .group_by(SalesMaster.customer_id, Customer.name) \
+            .order_by(revenue.desc()) \
+            .limit(limit).all()
+        return [{"customer_id": r[0], "name": r[1], "sales_count": r[2], "revenue": float(r[3] or 0)} for r in rows]
+    return analytics_cache.get_or_compute("sales", ("top_customers", start, end, limit), start, end, compute)
+
+def supplier_spend(db: Session, start: Optional[date] = None, end: Optional[date] = None, limit: int = 10):
+    def compute():
+        spend = func.sum(PurchaseMaster.total_amount)
+        rows = db.query(PurchaseMaster.supplier_id, Supplier.name, func.count(PurchaseMaster.id), spend) \
+            .join(Supplier, Supplier.id == PurchaseMaster.supplier_id) \
+            .filter(*_in_range(PurchaseMaster.purchase_date, start, end)) \
+            .group_by(PurchaseMaster.supplier_id, Supplier.name) \
+            .order_by(spend.desc()) \
+            .limit(limit).all()
+        return [{"supplier_id": r[0], "name": r[1], "purchase_count": r[2], "spend": float(r[3] or 0)} for r in rows]
+    return analytics_cache.get_or_compute("purchases", ("supplier_spend", start, end, limit), start, end, compute)
@@ -0,0 +1,188 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, Enum as SQLEnum, Index, func, select, text
+
+import models  # registers every table on Base.metadata
+from database import engine, Base
+
+# Streaming export and bulk restore of the whole database.
+#
+# An archive is a directory holding manifest.json and, per table, gzip
+# compressed NDJSON chunks of CHUNK_ROWS rows each:
+#
+#   backup/manifest.json
+#   backup/items/000000.ndjson.gz
+#   backup/sales_master/000000.ndjson.gz
+#   ...
+#
+# Export pages through each table by primary key inside one transaction, so
+# memory stays bounded by one chunk and the archive is a consistent snapshot.
+# Restore loads the chunks with multi-row INSERTs and builds secondary
+# indexes once at the end instead of row by row. MySQL will not drop an index
+# that backs a foreign key (error 1553), so while the composite indexes that
+# lead with a foreign key column are gone, a plain index on that column stands
+# in for them and is dropped again once they are rebuilt.
+
+FORMAT_VERSION = 1
+CHUNK_ROWS = 50000
+INSERT_BATCH_ROWS = 5000
+COMPRESS_LEVEL = 3
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "name") and hasattr(value, "value"):
+        # Enum members are stored by name, like SQLAlchemy does
+        return value.name
+    return value
+
+def _decoders(table):
+    decoders = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            decoders[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Date):
+            decoders[column.name] = date.fromisoformat
+        elif isinstance(column.type, SQLEnum) and column.type.enum_class is not None:
+            decoders[column.name] = lambda name, enum_class=column.type.enum_class: enum_class[name]
+    return decoders
+
+def export_database(out_dir: str):
+    os.makedirs(out_dir, exist_ok=False)
+    manifest = {"format": FORMAT_VERSION, "created_at": datetime.utcnow().isoformat(), "tables": []}
+
+    with engine.connect() as conn:
+        if engine.dialect.name == "mysql":
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            for table in Base.metadata.sorted_tables:
+                started = time.time()
+                key = list(table.primary_key.columns)[0]
+                columns = [c.name for c in table.columns]
+                os.makedirs(os.path.join(out_dir, table.name))
+
+                chunks, rows, last = [], 0, None
+                while True:
+                    query = select(table).order_by(key).limit(CHUNK_ROWS)
+                    if last is not None:
+                        query = query.where(key > last)
+                    batch = conn.execute(query).all()
+                    if not batch:
+                        break
+
+                    name = f"{table.name}/{len(chunks):06d}.ndjson.gz"
+                    with gzip.open(os.path.join(out_dir, name), "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL) as f:
+                        for row in batch:
+                            f.write(json.dumps([_encode(v) for v in row]))
+                            f.write("\n")
+                    chunks.append(name)
+                    rows += len(batch)
+                    last = getattr(batch[-1], key.name)
+
+                manifest["tables"].append({"name": table.name, "columns": columns, "rows": rows, "chunks": chunks})
+                print(f"  {table.name}: {rows} rows in {len(chunks)} chunks ({time.time() - started:.1f}s)")
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def _foreign_key_stand_ins(indexes) -> list:
+    """Plain indexes on the foreign key columns that lead any of indexes"""
+    stand_ins = {}
+    for index in indexes:
+        column = list(index.columns)[0]
+        name = f"ix_restore_{index.table.name}_{column.name}"
+        if column.foreign_keys and name not in stand_ins:
+            stand_in = Index(name, column)
+            # Only for the restore: keep it out of the model's table definition
+            index.table.indexes.discard(stand_in)
+            stand_ins[name] = stand_in
+    return list(stand_ins.values())
+
+def restore_database(in_dir: str):
+    with open(os.path.join(in_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported archive format: {manifest.get('format')}")
+
+    Base.metadata.create_all(bind=engine)
+    tables = Base.metadata.tables
+
+    with engine.connect() as conn:
+        for entry in manifest["tables"]:
+            if conn.execute(select(func.count()).select_from(tables[entry["name"]])).scalar():
+                raise ValueError(f"Table {entry['name']} is not empty, restore needs an empty database")
+
+        # Defer index maintenance and constraint checks until the data is in
+        if engine.dialect.name == "mysql":
+            conn.execute(text("SET foreign_key_checks = 0"))
+            conn.execute(text("SET unique_checks = 0"))
+        deferred = [
+            index for entry in manifest["tables"] for index in tables[entry["name"]].indexes
+            if not index.unique
+        ]
+        stand_ins = _foreign_key_stand_ins(deferred)
+        for index in stand_ins:
+            index.create(conn, checkfirst=True)
+        for index in deferred:
+            index.drop(conn)
+        conn.commit()
+
+        try:
+            for entry in manifest["tables"]:
+                started = time.time()
+                table = tables[entry["name"]]
+                columns = entry["columns"]
+                decoders = _decoders(table)
+                rows = 0
+                for chunk in entry["chunks"]:
+                    batch = []
+                    with gzip.open(os.path.join(in_dir, chunk), "rt", encoding="utf-8") as f:
+                        for line in f:
+                            row = dict(zip(columns, json.loads(line)))
+                            for name, decode in decoders.items():
+                                if row.get(name) is not None:
+                                    row[name] = decode(row[name])
+                            batch.append(row)
+                            if len(batch) >= INSERT_BATCH_ROWS:
+                                conn.execute(table.insert(), batch)
+                                rows += len(batch)
+                                batch = []
+                    if batch:
+                        conn.execute(table.insert(), batch)
+                        rows += len(batch)
+                    conn.commit()
+                print(f"  {table.name}: {rows} rows ({time.time() - started:.1f}s)")
+        finally:
+            # Drop a half-loaded chunk if the load failed
+            conn.rollback()
+            if engine.dialect.name == "mysql":
+                conn.execute(text("SET unique_checks = 1"))
+                conn.execute(text("SET foreign_key_checks = 1"))
+            started = time.time()
+            for index in deferred:
+                index.create(conn)
+            for index in stand_ins:
+                index.drop(conn, checkfirst=True)
+            conn.commit()
+            print(f"  rebuilt {len(deferred)} indexes ({time.time() - started:.1f}s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or restore the POS database")
+    parser.add_argument("command", choices=["export", "restore"])
+    parser.add_argument("path", help="archive directory")
+    args = parser.parse_args()
+
+    started = time.time()
+    if args.command == "export":
+        print(f"Exporting database to {args.path}")
+        export_database(args.path)
+    else:
+        print(f"Restoring database from {args.path}")
+        restore_database(args.path)
+    print(f"Done in {time.time() - started:.1f}s")
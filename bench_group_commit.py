@@ -0,0 +1,154 @@
+import argparse
+import random
+import threading
+import time
+from datetime import date
+
+from database import SessionLocal
+from models import (
+    Item, Customer, Supplier, SalesMaster, SalesDetail, PurchaseMaster, PurchaseDetail,
+    ItemLedger, CashFlow, PartyBalanceCheckpoint
+)
+from schemas import SalesCreate, PurchaseCreate
+from group_commit import GroupCommitter
+from main import record_sale, record_purchase
+
+# Commits per second vs. write latency with and without group commit.
+#
+# Writer threads ring up sales (and every PURCHASE_EVERY-th write a purchase)
+# through record_sale / record_purchase, the same code POST /api/sales and
+# POST /api/purchases run, over a small set of items so the item rows are
+# contended like at a busy till. Window 0 commits every write in its own
+# session; other windows go through a GroupCommitter with that window.
+# The benchmark creates its own customer, supplier and items and deletes
+# everything it wrote at the end, but run it against a scratch database.
+#
+#   DATABASE_URL=mysql+pymysql://root:@localhost/pos_bench python bench_group_commit.py --threads 32 --seconds 10
+
+PURCHASE_EVERY = 5
+BENCH_NAME = "BENCH-GROUP-COMMIT"
+
+def _setup(items: int) -> dict:
+    db = SessionLocal()
+    try:
+        customer = Customer(name=BENCH_NAME)
+        supplier = Supplier(name=BENCH_NAME)
+        stock = [Item(name=f"{BENCH_NAME}-{n}", current_stock=1e9) for n in range(items)]
+        db.add_all([customer, supplier] + stock)
+        db.commit()
+        return {"customer_id": customer.id, "supplier_id": supplier.id, "item_ids": [item.id for item in stock]}
+    finally:
+        db.close()
+
+def _cleanup(fixture: dict):
+    db = SessionLocal()
+    try:
+        item_ids = fixture["item_ids"]
+        sales_ids = [row[0] for row in db.query(SalesMaster.id).filter(SalesMaster.customer_id == fixture["customer_id"]).all()]
+        purchase_ids = [row[0] for row in db.query(PurchaseMaster.id).filter(PurchaseMaster.supplier_id == fixture["supplier_id"]).all()]
+        refs = [f"SALES-{i}" for i in sales_ids] + [f"PURCHASE-{i}" for i in purchase_ids]
+        for start in range(0, len(refs), 1000):
+            db.query(CashFlow).filter(CashFlow.ref_id.in_(refs[start:start + 1000])).delete(synchronize_session=False)
+        db.query(ItemLedger).filter(ItemLedger.item_id.in_(item_ids)).delete(synchronize_session=False)
+        db.query(SalesDetail).filter(SalesDetail.item_id.in_(item_ids)).delete(synchronize_session=False)
+        db.query(PurchaseDetail).filter(PurchaseDetail.item_id.in_(item_ids)).delete(synchronize_session=False)
+        db.query(SalesMaster).filter(SalesMaster.customer_id == fixture["customer_id"]).delete(synchronize_session=False)
+        db.query(PurchaseMaster).filter(PurchaseMaster.supplier_id == fixture["supplier_id"]).delete(synchronize_session=False)
+        db.query(PartyBalanceCheckpoint).filter(
+            ((PartyBalanceCheckpoint.party_type == "customer") & (PartyBalanceCheckpoint.party_id == fixture["customer_id"])) |
+            ((PartyBalanceCheckpoint.party_type == "supplier") & (PartyBalanceCheckpoint.party_id == fixture["supplier_id"]))
+        ).delete(synchronize_session=False)
+        db.query(Item).filter(Item.id.in_(item_ids)).delete(synchronize_session=False)
+        db.query(Customer).filter(Customer.id == fixture["customer_id"]).delete(synchronize_session=False)
+        db.query(Supplier).filter(Supplier.id == fixture["supplier_id"]).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def _next_write(fixture: dict, n: int):
+    today = date.today()
+    lines = [
+        {"item_id": item_id, "quantity": random.randint(1, 3), "rate": 10.0}
+        for item_id in random.sample(fixture["item_ids"], min(random.randint(1, 3), len(fixture["item_ids"])))
+    ]
+    if n % PURCHASE_EVERY == 0:
+        purchase = PurchaseCreate(purchase_date=today, supplier_id=fixture["supplier_id"], details=lines)
+        return lambda db: record_purchase(db, purchase, BENCH_NAME)
+    sale = SalesCreate(sales_date=today, customer_id=fixture["customer_id"], details=lines)
+    return lambda db: record_sale(db, sale, BENCH_NAME)
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+def run(fixture: dict, window_ms: float, threads: int, seconds: float) -> dict:
+    committer = GroupCommitter(SessionLocal, window_ms=window_ms) if window_ms > 0 else None
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def writer(index):
+        n = index
+        while time.perf_counter() < deadline:
+            write = _next_write(fixture, n)
+            n += threads
+            started = time.perf_counter()
+            try:
+                if committer is not None:
+                    committer.submit(write)
+                else:
+                    db = SessionLocal()
+                    try:
+                        write(db)
+                        db.commit()
+                    except Exception:
+                        db.rollback()
+                        raise
+                    finally:
+                        db.close()
+            except Exception:
+                errors[index] += 1
+                continue
+            latencies[index].append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=writer, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    samples = [s for per_thread in latencies for s in per_thread]
+    commits = committer.stats()["commits"] if committer is not None else len(samples)
+    return {
+        "window_ms": window_ms,
+        "writes_per_sec": len(samples) / elapsed,
+        "commits_per_sec": commits / elapsed,
+        "avg_batch": len(samples) / commits if commits else 0.0,
+        "p50_ms": _percentile(samples, 0.50) * 1000,
+        "p95_ms": _percentile(samples, 0.95) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "errors": sum(errors)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark group commit for sale/purchase writes")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent writers")
+    parser.add_argument("--seconds", type=float, default=5, help="duration of each run")
+    parser.add_argument("--items", type=int, default=20, help="items the writers sell (fewer = more row contention)")
+    parser.add_argument("--windows", default="0,1,2,5,10", help="comma separated windows in ms (0 = no group commit)")
+    args = parser.parse_args()
+
+    fixture = _setup(args.items)
+    print(f"{args.threads} writers, {args.items} items, {args.seconds:g}s per run, {SessionLocal.kw['bind'].url.get_backend_name()}")
+    print(f"{'window ms':>10} {'writes/s':>10} {'commits/s':>10} {'avg batch':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        for window in (float(w) for w in args.windows.split(",")):
+            r = run(fixture, window, args.threads, args.seconds)
+            print(f"{r['window_ms']:>10g} {r['writes_per_sec']:>10.0f} {r['commits_per_sec']:>10.0f} {r['avg_batch']:>10.1f} "
+                  f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['errors']:>7}")
+    finally:
+        _cleanup(fixture)
@@ -1,21 +1,74 @@
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # MySQL Database Configuration
-SQLALCHEMY_DATABASE_URL = "mysql+pymysql://root:@localhost/pos_system"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "mysql+pymysql://root:@localhost/pos_system")
+
+# Optional read replica for GET endpoints and reports, e.g.
+#   READ_DATABASE_URL=mysql+pymysql://root:@localhost:3307/pos_system
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+
+# Reads fall back to the primary when the replica is further behind than this
+MAX_REPLICA_LAG_SECONDS = float(os.getenv("MAX_REPLICA_LAG_SECONDS", "5"))
+# Replica lag is probed at most this often
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+# A client that just wrote keeps reading from the primary for this long
+READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", "10"))
+
+# Connection pool size per engine; admission control budgets against it
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_CAPACITY = DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+def _create_engine(url):
+    if url.startswith("sqlite"):
+        return create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            echo=False
+        )
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        echo=False
+    )
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=False
-)
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = _create_engine(READ_DATABASE_URL) if READ_DATABASE_URL else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
+def create_missing_indexes(metadata):
+    """Create indexes declared on the models that an existing table lacks.
+
+    create_all() only creates missing tables, so an index added to a model
+    later never reaches a database created before it. Safe to run repeatedly.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                print(f"Creating missing index {index.name} on {table.name}...")
+                index.create(bind=engine)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -24,3 +77,94 @@ def get_db():
     finally:
         db.close()
 
+# Dependency to get a read-only DB session, served by the replica when it is healthy.
+# On the primary it reuses the request's get_db session (the one get_current_user
+# already holds), so a read takes one pool connection, not two. Middleware that has
+# already picked the database (single-flight) leaves its choice in request.state.
+def get_read_db(request: Request, db=Depends(get_db)):
+    replica = getattr(request.state, "use_replica", None)
+    if replica is None:
+        replica = use_replica(_client_key(request))
+    if not replica:
+        yield db
+        return
+    read_db = ReadSessionLocal()
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
+# ============================================
+# READ ROUTING
+# ============================================
+
+_lock = threading.Lock()
+_last_write = {}
+_lag = {"checked_at": 0.0, "seconds": None}
+
+def _client_key(request: Request):
+    return request.headers.get("authorization")
+
+def mark_write(request: Request):
+    """Pin the client to the primary so it reads its own writes"""
+    key = _client_key(request)
+    if key is None:
+        return
+    now = time.monotonic()
+    with _lock:
+        _last_write[key] = now
+        # Drop expired entries so the map stays bounded by active writers
+        if len(_last_write) > 10000:
+            for k in [k for k, t in _last_write.items() if now - t > READ_AFTER_WRITE_SECONDS]:
+                del _last_write[k]
+
+def last_write(key):
+    """time.monotonic() of the client's last successful write, or None"""
+    if key is None:
+        return None
+    with _lock:
+        return _last_write.get(key)
+
+def use_replica(key=None) -> bool:
+    if read_engine is engine:
+        return False
+    written_at = last_write(key)
+    if written_at is not None and time.monotonic() - written_at < READ_AFTER_WRITE_SECONDS:
+        return False
+    lag = replica_lag()
+    return lag is not None and lag <= MAX_REPLICA_LAG_SECONDS
+
+def replica_lag():
+    """Replica lag in seconds (cached), or None when unknown or replication is broken"""
+    now = time.monotonic()
+    with _lock:
+        if now - _lag["checked_at"] < REPLICA_LAG_CHECK_INTERVAL:
+            return _lag["seconds"]
+        _lag["checked_at"] = now
+    seconds = _probe_replica_lag()
+    with _lock:
+        _lag["seconds"] = seconds
+    return seconds
+
+def _probe_replica_lag():
+    try:
+        with read_engine.connect() as conn:
+            if read_engine.dialect.name != "mysql":
+                # Local replicas (e.g. a copied SQLite file) have no lag to report
+                conn.execute(text("SELECT 1"))
+                return 0.0
+            try:
+                row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                column = "Seconds_Behind_Source"
+            except Exception:
+                # MySQL < 8.0.22
+                row = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+                column = "Seconds_Behind_Master"
+            if row is None:
+                # Not configured as a replica, nothing to lag behind
+                return 0.0
+            lag = row.get(column)
+            return float(lag) if lag is not None else None
+    except Exception as e:
+        print(f"⚠️ Replica lag check failed: {str(e)}")
+        return None
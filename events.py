@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+# Server push channel for row-level change events.
+# Write handlers call publish() after they commit; every connected terminal
+# receives the event over Server-Sent Events and patches its tables in place.
+
+HISTORY_SIZE = 1000          # events kept for Last-Event-ID replay
+SUBSCRIBER_QUEUE_SIZE = 500  # a slower client gets a "reset" instead
+KEEPALIVE_SECONDS = 15
+
+class EventBroker:
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        # Ids continue from the boot time in microseconds, so they keep increasing
+        # across restarts and an id from before a restart is recognisable
+        self._boot_seq = time.time_ns() // 1000
+        self._seq = self._boot_seq
+
+    def publish(self, table: str, op: str, row: Any) -> dict:
+        """Broadcast a change event; safe to call from sync handlers"""
+        with self._lock:
+            self._seq += 1
+            event = {"id": self._seq, "table": table, "op": op, "row": jsonable_encoder(row)}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            loop, queue = subscriber
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # Event loop already closed
+                self.unsubscribe(subscriber)
+        return event
+
+    def subscribe(self, last_event_id: Optional[int] = None):
+        """Register a subscriber and return it with the events it missed"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            if last_event_id is None:
+                backlog = []
+            elif (last_event_id < self._boot_seq or last_event_id > self._seq
+                  or (self._history and last_event_id < self._history[0]["id"] - 1)):
+                # Client missed more than we kept, or its id is from before a
+                # restart: it has to reload its lists
+                backlog = [_reset_event(self._seq)]
+            else:
+                backlog = [e for e in self._history if e["id"] > last_event_id]
+            self._subscribers.add(subscriber)
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    async def stream(self, request, last_event_id: Optional[int] = None):
+        """Yield SSE frames until the client disconnects"""
+        subscriber, backlog = self.subscribe(last_event_id)
+        _, queue = subscriber
+        try:
+            yield "retry: 3000\n\n"
+            for event in backlog:
+                yield _format(event)
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _format(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+def _reset_event(seq: int) -> dict:
+    return {"id": seq, "table": "*", "op": "reset", "row": None}
+
+def _offer(queue: asyncio.Queue, event: dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # Drop the backlog and ask the client to reload from scratch
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(_reset_event(event["id"]))
+
+def _format(event: dict) -> str:
+    return f"id: {event['id']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+
+broker = EventBroker()
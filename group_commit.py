@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+
+from database import SessionLocal, POOL_CAPACITY
+
+# Group commit for sale and purchase writes.
+#
+# With GROUP_COMMIT_WINDOW_MS > 0, a write is handed to a single committer
+# thread instead of committing in the request's own session. The committer
+# waits up to the window for more writes to arrive (or GROUP_COMMIT_MAX_BATCH of
+# them), runs each one inside its own SAVEPOINT of a shared transaction and
+# commits the batch once, so N requests pay for one commit (one fsync on MySQL)
+# instead of N. A write that fails only rolls back its savepoint and gets its
+# own error; if the batch commit itself fails, the successful writes are
+# retried one transaction each.
+#
+# Callers must not hold a pooled connection while they wait in submit(), since
+# the committer needs one from the same pool. A write's on_commit callback runs
+# on the committer thread once the write is committed, so it runs even when the
+# request has already given up.
+
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "64"))
+# Longest a write waits to be picked up by a batch before it is dropped (never
+# once it is in a batch, since by then it may commit)
+GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", "30"))
+# Writes queued or in a batch at once; kept below the pool size so the committer
+# and other requests always find a connection
+GROUP_COMMIT_MAX_PENDING = int(os.getenv("GROUP_COMMIT_MAX_PENDING", str(max(POOL_CAPACITY - 1, 1))))
+
+class _PendingWrite:
+    __slots__ = ("write", "on_commit", "result", "error", "done", "submitted")
+
+    def __init__(self, write, on_commit=None):
+        self.write = write
+        self.on_commit = on_commit
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.submitted = time.perf_counter()
+
+class GroupCommitter:
+    def __init__(self, session_factory, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_batch: int = GROUP_COMMIT_MAX_BATCH,
+                 max_pending: int = GROUP_COMMIT_MAX_PENDING):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max(max_batch, 1)
+        self.max_pending = max(max_pending, 1)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._thread = None
+        self.writes = 0
+        self.batches = 0
+        self.commits = 0
+        self.failed_batches = 0
+        self.max_batch_seen = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def submit(self, write, on_commit=None):
+        """Run write(db) in the next batch and block until it is committed; returns its result.
+
+        Raises TimeoutError when the write was dropped before it started, so it is
+        safe to retry. on_commit(result) runs on the committer after the commit.
+        """
+        if not self._slots.acquire(timeout=GROUP_COMMIT_TIMEOUT):
+            raise TimeoutError(f"Too many writes waiting for {GROUP_COMMIT_TIMEOUT}s; the write was dropped")
+        try:
+            pending = _PendingWrite(write, on_commit)
+            with self._cond:
+                self._queue.append(pending)
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+            if not pending.done.wait(GROUP_COMMIT_TIMEOUT):
+                with self._cond:
+                    queued = pending in self._queue
+                    if queued:
+                        self._queue.remove(pending)
+                if queued:
+                    raise TimeoutError(f"Write was not started within {GROUP_COMMIT_TIMEOUT}s and was dropped")
+                # Already in a batch: it may still commit, so wait for the outcome
+                # (_run always finishes a batch, even when it fails)
+                pending.done.wait()
+        finally:
+            self._slots.release()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                # Collect writes for one window after the first arrives
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                # e.g. the rollback itself failed on a dropped connection; the thread must survive
+                print(f"❌ Group commit of {len(batch)} writes failed: {str(e)}")
+                for pending in batch:
+                    if pending.error is None and pending.result is None:
+                        pending.error = e
+            finally:
+                finished = time.perf_counter()
+                with self._cond:
+                    self.writes += len(batch)
+                    self.batches += 1
+                    self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                    self.wait_seconds += sum(finished - p.submitted for p in batch)
+                for pending in batch:
+                    pending.done.set()
+
+    def _commit_batch(self, batch):
+        db = self.session_factory()
+        committed = False
+        try:
+            for pending in batch:
+                savepoint = db.begin_nested()
+                try:
+                    pending.result = pending.write(db)
+                    savepoint.commit()
+                except Exception as e:
+                    pending.error = e
+                    pending.result = None
+                    savepoint.rollback()
+            db.commit()
+            self._count_commit()
+            committed = True
+        except Exception as e:
+            db.rollback()
+            with self._cond:
+                self.failed_batches += 1
+            print(f"❌ Group commit of {len(batch)} writes failed, committing individually: {str(e)}")
+        finally:
+            db.close()
+
+        if committed:
+            for pending in batch:
+                if pending.error is None:
+                    self._notify(pending)
+            return
+
+        # Fallback: one transaction per write that had not failed on its own
+        for pending in batch:
+            if pending.error is None:
+                self._commit_one(pending)
+
+    def _commit_one(self, pending: _PendingWrite):
+        db = self.session_factory()
+        try:
+            pending.result = pending.write(db)
+            db.commit()
+            self._count_commit()
+        except Exception as e:
+            db.rollback()
+            pending.result = None
+            pending.error = e
+            return
+        finally:
+            db.close()
+        self._notify(pending)
+
+    def _notify(self, pending: _PendingWrite):
+        if pending.on_commit is None:
+            return
+        try:
+            pending.on_commit(pending.result)
+        except Exception as e:
+            # The write is committed; a failed notification must not turn it into an error
+            print(f"❌ Group commit: notifying clients of a committed write failed: {str(e)}")
+
+    def _count_commit(self):
+        with self._cond:
+            self.commits += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "max_pending": self.max_pending,
+                "writes": self.writes,
+                "batches": self.batches,
+                "commits": self.commits,
+                "failed_batches": self.failed_batches,
+                "avg_batch_size": round(self.writes / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_latency_ms": round(self.wait_seconds / self.writes * 1000, 3) if self.writes else 0.0,
+                "queued": len(self._queue)
+            }
+
+group_committer = GroupCommitter(SessionLocal)
@@ -1,7 +1,7 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -9,7 +9,7 @@ from datetime import datetime, date
 from typing import List, Optional
 from pathlib import Path
 
-from database import SessionLocal, engine, Base, get_db
+from database import SessionLocal, engine, read_engine, Base, get_db, get_read_db, mark_write, create_missing_indexes
 from models import (
     User, Supplier, Customer, Item, PurchaseMaster, PurchaseDetail,
     SalesMaster, SalesDetail, CashFlow, ItemLedger, UserRole, Status,
@@ -17,9 +17,21 @@ from models import (
 )
 from schemas import *
 from auth import verify_token, get_password_hash, create_access_token, verify_password
-
-# Create database tables
+from events import broker
+from reconcile import reconcile_stock
+from analytics import analytics_cache, best_sellers, top_customers, supplier_spend
+from admission import admission
+from profiling import profiler
+from report_jobs import report_jobs, REPORT_KINDS
+from group_commit import group_committer
+from statements import party_statement, invalidate_checkpoints
+from single_flight import single_flight
+from terminal_sync import apply_sales_batch, MAX_SYNC_BATCH
+from stock_slots import get_slots, item_responses, shard_item, set_stock, take_stock, add_stock, start_compaction, MAX_STOCK_SLOTS
+
+# Create database tables, and the indexes added to existing ones since they were created
 Base.metadata.create_all(bind=engine)
+create_missing_indexes(Base.metadata)
 
 app = FastAPI(
     title="POS System API",
@@ -27,13 +39,33 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# CORS Middleware
+# Keep clients that just wrote on the primary so their next reads see the write
+@app.middleware("http")
+async def read_after_write(request: Request, call_next):
+    response = await call_next(request)
+    if request.method != "GET" and request.url.path.startswith("/api/") and response.status_code < 400:
+        mark_write(request)
+    return response
+
+# On-demand profiling (X-Profile header from an admin, or PROFILE_SAMPLE_RATE)
+app.middleware("http")(profiler)
+
+# Admission control runs first so rejected requests never touch the pool
+app.middleware("http")(admission)
+
+# Identical concurrent reads of hot endpoints share one query; outermost, so
+# requests served from another request's response never take an admission slot
+app.middleware("http")(single_flight)
+
+# CORS Middleware; added last so it is outermost and also covers the responses the
+# middleware above answers on its own (429/503 rejections, shared reads)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 # Mount static files
@@ -56,6 +88,11 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+def get_admin_user(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     with open("index.html", "r") as f:
@@ -78,6 +115,43 @@ async def startup_event():
             print("Default admin user created")
     finally:
         db.close()
+    start_compaction(SessionLocal)
+
+# ============================================
+# PUSH EVENTS
+# ============================================
+
+def publish_items(item_ids):
+    """Broadcast the current stock of the given items"""
+    db = SessionLocal()
+    try:
+        for item in item_responses(db, db.query(Item).filter(Item.id.in_(item_ids)).all()):
+            broker.publish("items", "upsert", item)
+    finally:
+        db.close()
+
+def publish_transaction(table: str, master, details, cashflow: CashFlow):
+    """Broadcast a committed sale/purchase with the stock and cash flow rows it changed"""
+    broker.publish(table, "upsert", master)
+    publish_items({detail.item_id for detail in details})
+    broker.publish("cashflow", "upsert", CashFlowResponse.model_validate(cashflow))
+
+@app.get("/api/events")
+async def stream_events(request: Request, token: str, last_event_id: Optional[int] = None):
+    # EventSource cannot send an Authorization header, so the token comes in the query string
+    payload = verify_token(token)
+    if payload is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+    
+    return StreamingResponse(
+        broker.stream(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ============================================
 # AUTHENTICATION ENDPOINTS
@@ -102,17 +176,35 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
 # SUPPLIER ENDPOINTS
 # ============================================
 
+# Primary, not the replica: terminals load this list once and then patch it from push
+# events, so a row committed while the replica lagged would be missing for good
 @app.get("/api/suppliers", response_model=List[SupplierResponse])
 def get_suppliers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     suppliers = db.query(Supplier).offset(skip).limit(limit).all()
     return suppliers
 
+def get_statement(party_type: str, party_id: int, start_date: Optional[date], end_date: Optional[date], db: Session):
+    end_date = end_date or date.today()
+    start_date = start_date or end_date.replace(day=1)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    statement = party_statement(db, party_type, party_id, start_date, end_date)
+    if statement is None:
+        raise HTTPException(status_code=404, detail=f"{party_type.capitalize()} not found")
+    return statement
+
+@app.get("/api/suppliers/{supplier_id}/statement", response_model=StatementResponse)
+def get_supplier_statement(supplier_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    # Primary session: checkpoints missing for the range are stored on the way
+    return get_statement("supplier", supplier_id, start_date, end_date, db)
+
 @app.post("/api/suppliers", response_model=SupplierResponse)
 def create_supplier(supplier: SupplierCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     db_supplier = Supplier(**supplier.dict())
     db.add(db_supplier)
     db.commit()
     db.refresh(db_supplier)
+    broker.publish("suppliers", "upsert", SupplierResponse.model_validate(db_supplier))
     return db_supplier
 
 @app.put("/api/suppliers/{supplier_id}", response_model=SupplierResponse)
@@ -126,6 +218,7 @@ def update_supplier(supplier_id: int, supplier: SupplierUpdate, db: Session = De
     
     db.commit()
     db.refresh(db_supplier)
+    broker.publish("suppliers", "upsert", SupplierResponse.model_validate(db_supplier))
     return db_supplier
 
 @app.delete("/api/suppliers/{supplier_id}")
@@ -136,23 +229,31 @@ def delete_supplier(supplier_id: int, db: Session = Depends(get_db), current_use
     
     db.delete(db_supplier)
     db.commit()
+    broker.publish("suppliers", "delete", {"id": supplier_id})
     return {"message": "Supplier deleted successfully"}
 
 # ============================================
 # CUSTOMER ENDPOINTS
 # ============================================
 
+# Seeds a terminal's list, so it reads the primary (see get_suppliers)
 @app.get("/api/customers", response_model=List[CustomerResponse])
 def get_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     customers = db.query(Customer).offset(skip).limit(limit).all()
     return customers
 
+@app.get("/api/customers/{customer_id}/statement", response_model=StatementResponse)
+def get_customer_statement(customer_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    # Primary session: checkpoints missing for the range are stored on the way
+    return get_statement("customer", customer_id, start_date, end_date, db)
+
 @app.post("/api/customers", response_model=CustomerResponse)
 def create_customer(customer: CustomerCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     db_customer = Customer(**customer.dict())
     db.add(db_customer)
     db.commit()
     db.refresh(db_customer)
+    broker.publish("customers", "upsert", CustomerResponse.model_validate(db_customer))
     return db_customer
 
 @app.put("/api/customers/{customer_id}", response_model=CustomerResponse)
@@ -166,6 +267,7 @@ def update_customer(customer_id: int, customer: CustomerUpdate, db: Session = De
     
     db.commit()
     db.refresh(db_customer)
+    broker.publish("customers", "upsert", CustomerResponse.model_validate(db_customer))
     return db_customer
 
 @app.delete("/api/customers/{customer_id}")
@@ -176,16 +278,18 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db), current_use
     
     db.delete(db_customer)
     db.commit()
+    broker.publish("customers", "delete", {"id": customer_id})
     return {"message": "Customer deleted successfully"}
 
 # ============================================
 # ITEM ENDPOINTS
 # ============================================
 
+# Seeds a terminal's list, so it reads the primary (see get_suppliers)
 @app.get("/api/items", response_model=List[ItemResponse])
 def get_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     items = db.query(Item).offset(skip).limit(limit).all()
-    return items
+    return item_responses(db, items)
 
 @app.post("/api/items", response_model=ItemResponse)
 def create_item(item: ItemCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -193,6 +297,7 @@ def create_item(item: ItemCreate, db: Session = Depends(get_db), current_user: U
     db.add(db_item)
     db.commit()
     db.refresh(db_item)
+    broker.publish("items", "upsert", ItemResponse.model_validate(db_item))
     return db_item
 
 @app.put("/api/items/{item_id}", response_model=ItemResponse)
@@ -201,12 +306,34 @@ def update_item(item_id: int, item: ItemUpdate, db: Session = Depends(get_db), c
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    for key, value in item.dict(exclude_unset=True).items():
+    updates = item.dict(exclude_unset=True)
+    if "current_stock" in updates and get_slots(db, item_id):
+        set_stock(db, db_item, updates.pop("current_stock"))
+    
+    for key, value in updates.items():
         setattr(db_item, key, value)
     
     db.commit()
     db.refresh(db_item)
-    return db_item
+    response = item_responses(db, [db_item])[0]
+    broker.publish("items", "upsert", response)
+    return response
+
+@app.post("/api/items/{item_id}/stock-slots", response_model=ItemResponse)
+def set_item_stock_slots(item_id: int, slots: int, db: Session = Depends(get_db), current_user: User = Depends(get_admin_user)):
+    # Split a hot item's stock over several counters (slots=0 turns it off)
+    if slots < 0 or slots > MAX_STOCK_SLOTS:
+        raise HTTPException(status_code=400, detail=f"slots must be between 0 and {MAX_STOCK_SLOTS}")
+    db_item = db.query(Item).filter(Item.id == item_id).first()
+    if not db_item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    
+    shard_item(db, db_item, slots)
+    db.commit()
+    db.refresh(db_item)
+    response = item_responses(db, [db_item])[0]
+    broker.publish("items", "upsert", response)
+    return response
 
 @app.delete("/api/items/{item_id}")
 def delete_item(item_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -214,21 +341,24 @@ def delete_item(item_id: int, db: Session = Depends(get_db), current_user: User
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
     
+    shard_item(db, db_item, 0)
     db.delete(db_item)
     db.commit()
+    broker.publish("items", "delete", {"id": item_id})
     return {"message": "Item deleted successfully"}
 
 # ============================================
 # PURCHASE ENDPOINTS
 # ============================================
 
+# Seeds a terminal's list, so it reads the primary (see get_suppliers)
 @app.get("/api/purchases", response_model=List[PurchaseMasterResponse])
 def get_purchases(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     purchases = db.query(PurchaseMaster).offset(skip).limit(limit).all()
     return purchases
 
 @app.get("/api/purchases/{purchase_id}", response_model=PurchaseMasterDetailResponse)
-def get_purchase(purchase_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_purchase(purchase_id: int, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)):
     purchase = db.query(PurchaseMaster).filter(PurchaseMaster.id == purchase_id).first()
     if not purchase:
         raise HTTPException(status_code=404, detail="Purchase not found")
@@ -236,64 +366,89 @@ def get_purchase(purchase_id: int, db: Session = Depends(get_db), current_user:
     details = db.query(PurchaseDetail).filter(PurchaseDetail.purchase_id == purchase_id).all()
     return {"master": purchase, "details": details}
 
-@app.post("/api/purchases", response_model=PurchaseMasterResponse)
-def create_purchase(purchase: PurchaseCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def record_purchase(db: Session, purchase: PurchaseCreate, username: str):
+    """Write a purchase with its stock, ledger and cash flow rows (flushed, not committed)"""
     # Create purchase master
-    try:
-        db_purchase = PurchaseMaster(
-            purchase_date=purchase.purchase_date,
-            supplier_id=purchase.supplier_id,
-            created_by=current_user.username
+    db_purchase = PurchaseMaster(
+        purchase_date=purchase.purchase_date,
+        supplier_id=purchase.supplier_id,
+        created_by=username
+    )
+    db.add(db_purchase)
+    db.flush()
+    invalidate_checkpoints(db, "supplier", purchase.supplier_id, purchase.purchase_date)
+    
+    # Create purchase details and update inventory
+    total_amount = 0.0
+    for detail in purchase.details:
+        db_detail = PurchaseDetail(
+            purchase_id=db_purchase.id,
+            item_id=detail.item_id,
+            quantity=detail.quantity,
+            rate=detail.rate
         )
-        db.add(db_purchase)
-        db.flush()
+        db.add(db_detail)
+        total_amount += detail.quantity * detail.rate
         
-        # Create purchase details and update inventory
-        total_amount = 0.0
-        for detail in purchase.details:
-            db_detail = PurchaseDetail(
-                purchase_id=db_purchase.id,
-                item_id=detail.item_id,
-                quantity=detail.quantity,
-                rate=detail.rate
-            )
-            db.add(db_detail)
-            total_amount += detail.quantity * detail.rate
-            
-            # Update item stock
-            item = db.query(Item).filter(Item.id == detail.item_id).first()
-            if item:
+        # Update item stock
+        item = db.query(Item).filter(Item.id == detail.item_id).first()
+        if item:
+            slots = get_slots(db, item.id)
+            if slots:
+                add_stock(db, item.id, detail.quantity, slots)
+            else:
                 item.current_stock += detail.quantity
-            
-            # Create ledger entry
-            ledger = ItemLedger(
-                item_id=detail.item_id,
-                movement_date=purchase.purchase_date,
-                movement_type=MovementType.IN,
-                quantity=detail.quantity,
-                movement_reference=f"PURCHASE-{db_purchase.id}"
-            )
-            db.add(ledger)
         
-        db_purchase.total_amount = total_amount
-        
-        # Create cash flow entry for purchase (OUTFLOW)
-        cashflow = CashFlow(
-            transaction_date=purchase.purchase_date,
-            type=CashFlowType.OUT,
-            amount=total_amount,
-            description=f"Purchase from Supplier - Purchase #{db_purchase.id}",
-            ref_id=f"PURCHASE-{db_purchase.id}"
+        # Create ledger entry
+        ledger = ItemLedger(
+            item_id=detail.item_id,
+            movement_date=purchase.purchase_date,
+            movement_type=MovementType.IN,
+            quantity=detail.quantity,
+            movement_reference=f"PURCHASE-{db_purchase.id}"
         )
-        db.add(cashflow)
-        
-        # Commit everything together
-        db.commit()
-        db.refresh(db_purchase)
-        
-        print(f"✅ Purchase created: ID={db_purchase.id}, Amount={total_amount}, CashFlow added")
-        return db_purchase
+        db.add(ledger)
+    
+    db_purchase.total_amount = total_amount
+    
+    # Create cash flow entry for purchase (OUTFLOW)
+    cashflow = CashFlow(
+        transaction_date=purchase.purchase_date,
+        type=CashFlowType.OUT,
+        amount=total_amount,
+        description=f"Purchase from Supplier - Purchase #{db_purchase.id}",
+        ref_id=f"PURCHASE-{db_purchase.id}"
+    )
+    db.add(cashflow)
+    db.flush()
+    return PurchaseMasterResponse.model_validate(db_purchase), CashFlowResponse.model_validate(cashflow)
+
+def notify_purchase(purchase: PurchaseCreate, result):
+    """Drop cached analytics for a committed purchase and broadcast it"""
+    db_purchase, cashflow = result
+    analytics_cache.invalidate("purchases", purchase.purchase_date)
+    publish_transaction("purchases", db_purchase, purchase.details, cashflow)
+
+@app.post("/api/purchases", response_model=PurchaseMasterResponse)
+def create_purchase(purchase: PurchaseCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    username = current_user.username
+    try:
+        if group_committer.enabled:
+            # Committed together with other concurrent sales/purchases. The committer needs
+            # a connection from the same pool, so this request gives its own back first.
+            db.close()
+            db_purchase, cashflow = group_committer.submit(
+                lambda session: record_purchase(session, purchase, username),
+                on_commit=lambda result: notify_purchase(purchase, result)
+            )
+        else:
+            db_purchase, cashflow = record_purchase(db, purchase, username)
+            db.commit()
             
+    except TimeoutError as e:
+        # Dropped before it was written, so the client can safely retry
+        print(f"❌ Purchase failed: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Server busy, please retry: {str(e)}", headers={"Retry-After": "1"})
     except HTTPException:
         db.rollback()
         print("❌ Purchase failed: HTTPException")
@@ -302,18 +457,30 @@ def create_purchase(purchase: PurchaseCreate, db: Session = Depends(get_db), cur
         db.rollback()
         print(f"❌ Purchase failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create purchase: {str(e)}")
+    
+    # Committed: a failure from here on must not answer 500, or the client would retry and record it twice.
+    # Group commit already notified from the committer thread.
+    if not group_committer.enabled:
+        try:
+            notify_purchase(purchase, (db_purchase, cashflow))
+        except Exception as e:
+            print(f"❌ Purchase {db_purchase.id} saved, but notifying clients failed: {str(e)}")
+    
+    print(f"✅ Purchase created: ID={db_purchase.id}, Amount={db_purchase.total_amount}, CashFlow added")
+    return db_purchase
 
 # ============================================
 # SALES ENDPOINTS
 # ============================================
 
+# Seeds a terminal's list, so it reads the primary (see get_suppliers)
 @app.get("/api/sales", response_model=List[SalesMasterResponse])
 def get_sales(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     sales = db.query(SalesMaster).offset(skip).limit(limit).all()
     return sales
 
 @app.get("/api/sales/{sales_id}", response_model=SalesMasterDetailResponse)
-def get_sale(sales_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_sale(sales_id: int, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)):
     sale = db.query(SalesMaster).filter(SalesMaster.id == sales_id).first()
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
@@ -321,69 +488,97 @@ def get_sale(sales_id: int, db: Session = Depends(get_db), current_user: User =
     details = db.query(SalesDetail).filter(SalesDetail.sales_id == sales_id).all()
     return {"master": sale, "details": details}
 
-@app.post("/api/sales", response_model=SalesMasterResponse)
-def create_sale(sale: SalesCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def record_sale(db: Session, sale: SalesCreate, username: str):
+    """Write a sale with its stock, ledger and cash flow rows (flushed, not committed)"""
     # Create sales master
-    try:
-        db_sale = SalesMaster(
-            sales_date=sale.sales_date,
-            customer_id=sale.customer_id,
-            created_by=current_user.username
+    db_sale = SalesMaster(
+        sales_date=sale.sales_date,
+        customer_id=sale.customer_id,
+        created_by=username
+    )
+    db.add(db_sale)
+    db.flush()
+    invalidate_checkpoints(db, "customer", sale.customer_id, sale.sales_date)
+    
+    # Create sales details and update inventory
+    total_amount = 0.0
+    for detail in sale.details:
+        # Check stock availability
+        item = db.query(Item).filter(Item.id == detail.item_id).first()
+        if not item:
+            raise HTTPException(status_code=404, detail=f"Item {detail.item_id} not found")
+        slots = get_slots(db, item.id)
+        if slots:
+            # Sharded hot item: take the stock from one of its slots
+            if not take_stock(db, item.id, detail.quantity, slots):
+                available = sum(s.quantity for s in get_slots(db, item.id))
+                raise HTTPException(status_code=400, detail=f"Insufficient stock for item {item.name}. Available: {available}")
+        elif item.current_stock < detail.quantity:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for item {item.name}. Available: {item.current_stock}")
+        
+        db_detail = SalesDetail(
+            sales_id=db_sale.id,
+            item_id=detail.item_id,
+            quantity=detail.quantity,
+            rate=detail.rate
         )
-        db.add(db_sale)
-        db.flush()
+        db.add(db_detail)
+        total_amount += detail.quantity * detail.rate
         
-        # Create sales details and update inventory
-        total_amount = 0.0
-        for detail in sale.details:
-            # Check stock availability
-            item = db.query(Item).filter(Item.id == detail.item_id).first()
-            if not item:
-                raise HTTPException(status_code=404, detail=f"Item {detail.item_id} not found")
-            if item.current_stock < detail.quantity:
-                raise HTTPException(status_code=400, detail=f"Insufficient stock for item {item.name}. Available: {item.current_stock}")
-            
-            db_detail = SalesDetail(
-                sales_id=db_sale.id,
-                item_id=detail.item_id,
-                quantity=detail.quantity,
-                rate=detail.rate
-            )
-            db.add(db_detail)
-            total_amount += detail.quantity * detail.rate
-            
-            # Update item stock
+        # Update item stock
+        if not slots:
             item.current_stock -= detail.quantity
-            
-            # Create ledger entry
-            ledger = ItemLedger(
-                item_id=detail.item_id,
-                movement_date=sale.sales_date,
-                movement_type=MovementType.OUT,
-                quantity=detail.quantity,
-                movement_reference=f"SALES-{db_sale.id}"
-            )
-            db.add(ledger)
-        
-        db_sale.total_amount = total_amount
         
-        # Create cash flow entry for sales (INFLOW)
-        cashflow = CashFlow(
-                transaction_date=sale.sales_date,
-                type=CashFlowType.IN,
-                amount=total_amount,
-                description=f"Sale to Customer - Sales #{db_sale.id}",
-                ref_id=f"SALES-{db_sale.id}"
+        # Create ledger entry
+        ledger = ItemLedger(
+            item_id=detail.item_id,
+            movement_date=sale.sales_date,
+            movement_type=MovementType.OUT,
+            quantity=detail.quantity,
+            movement_reference=f"SALES-{db_sale.id}"
+        )
+        db.add(ledger)
+    
+    db_sale.total_amount = total_amount
+    
+    # Create cash flow entry for sales (INFLOW)
+    cashflow = CashFlow(
+            transaction_date=sale.sales_date,
+            type=CashFlowType.IN,
+            amount=total_amount,
+            description=f"Sale to Customer - Sales #{db_sale.id}",
+            ref_id=f"SALES-{db_sale.id}"
+        )
+    db.add(cashflow)
+    db.flush()
+    return SalesMasterResponse.model_validate(db_sale), CashFlowResponse.model_validate(cashflow)
+
+def notify_sale(sale: SalesCreate, result):
+    """Drop cached analytics for a committed sale and broadcast it"""
+    db_sale, cashflow = result
+    analytics_cache.invalidate("sales", sale.sales_date)
+    publish_transaction("sales", db_sale, sale.details, cashflow)
+
+@app.post("/api/sales", response_model=SalesMasterResponse)
+def create_sale(sale: SalesCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    username = current_user.username
+    try:
+        if group_committer.enabled:
+            # Committed together with other concurrent sales/purchases. The committer needs
+            # a connection from the same pool, so this request gives its own back first.
+            db.close()
+            db_sale, cashflow = group_committer.submit(
+                lambda session: record_sale(session, sale, username),
+                on_commit=lambda result: notify_sale(sale, result)
             )
-        db.add(cashflow)
-        
-        # Commit everything together
-        db.commit()
-        db.refresh(db_sale)
-        
-        print(f"✅ Sale created: ID={db_sale.id}, Amount={total_amount}, CashFlow added")
-        return db_sale
+        else:
+            db_sale, cashflow = record_sale(db, sale, username)
+            db.commit()
         
+    except TimeoutError as e:
+        # Dropped before it was written, so the client can safely retry
+        print(f"❌ Sale failed: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Server busy, please retry: {str(e)}", headers={"Retry-After": "1"})
     except HTTPException:
         db.rollback()
         print("❌ Sale failed: HTTPException")
@@ -392,11 +587,54 @@ def create_sale(sale: SalesCreate, db: Session = Depends(get_db), current_user:
         db.rollback()
         print(f"❌ Sale failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create sale: {str(e)}")
+    
+    # Committed: a failure from here on must not answer 500, or the client would retry and record it twice.
+    # Group commit already notified from the committer thread.
+    if not group_committer.enabled:
+        try:
+            notify_sale(sale, (db_sale, cashflow))
+        except Exception as e:
+            print(f"❌ Sale {db_sale.id} saved, but notifying clients failed: {str(e)}")
+    
+    print(f"✅ Sale created: ID={db_sale.id}, Amount={db_sale.total_amount}, CashFlow added")
+    return db_sale
+
+# ============================================
+# TERMINAL SYNC ENDPOINTS
+# ============================================
+
+@app.post("/api/sync/sales", response_model=SalesSyncResponse)
+def sync_sales(batch: SalesSyncRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    # Sales queued by a terminal while offline, applied in one transaction
+    if len(batch.sales) > MAX_SYNC_BATCH:
+        raise HTTPException(status_code=400, detail=f"A sync batch holds at most {MAX_SYNC_BATCH} sales")
+    try:
+        applied = apply_sales_batch(db, batch, current_user.username)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Sales sync failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to sync sales: {str(e)}")
+    
+    try:
+        for sales_date in {sale.sales_date for sale in applied["sales"]}:
+            analytics_cache.invalidate("sales", sales_date)
+        for sale in applied["sales"]:
+            broker.publish("sales", "upsert", sale)
+        if applied["item_ids"]:
+            publish_items(applied["item_ids"])
+        for cashflow in applied["cashflows"]:
+            broker.publish("cashflow", "upsert", cashflow)
+    except Exception as e:
+        print(f"❌ Sales sync saved, but notifying clients failed: {str(e)}")
+    
+    print(f"✅ Sales sync: {len(applied['sales'])} of {len(batch.sales)} sales accepted")
+    return {"results": applied["results"]}
 
 # ============================================
 # CASH FLOW ENDPOINTS
 # ============================================
 
+# Seeds a terminal's list, so it reads the primary (see get_suppliers)
 @app.get("/api/cashflow", response_model=List[CashFlowResponse])
 def get_cashflow(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     cashflows = db.query(CashFlow).offset(skip).limit(limit).all()
@@ -408,6 +646,7 @@ def create_cashflow(cashflow: CashFlowCreate, db: Session = Depends(get_db), cur
     db.add(db_cashflow)
     db.commit()
     db.refresh(db_cashflow)
+    broker.publish("cashflow", "upsert", CashFlowResponse.model_validate(db_cashflow))
     return db_cashflow
 
 @app.put("/api/cashflow/{cashflow_id}", response_model=CashFlowResponse)
@@ -421,6 +660,7 @@ def update_cashflow(cashflow_id: int, cashflow: CashFlowUpdate, db: Session = De
     
     db.commit()
     db.refresh(db_cashflow)
+    broker.publish("cashflow", "upsert", CashFlowResponse.model_validate(db_cashflow))
     return db_cashflow
 
 @app.delete("/api/cashflow/{cashflow_id}")
@@ -431,6 +671,7 @@ def delete_cashflow(cashflow_id: int, db: Session = Depends(get_db), current_use
     
     db.delete(db_cashflow)
     db.commit()
+    broker.publish("cashflow", "delete", {"id": cashflow_id})
     return {"message": "Cash flow entry deleted successfully"}
 
 # ============================================
@@ -438,7 +679,7 @@ def delete_cashflow(cashflow_id: int, db: Session = Depends(get_db), current_use
 # ============================================
 
 @app.get("/api/reports/inventory", response_model=List[ItemLedgerResponse])
-def get_inventory_report(item_id: Optional[int] = None, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_inventory_report(item_id: Optional[int] = None, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)):
     query = db.query(ItemLedger)
     if item_id:
         query = query.filter(ItemLedger.item_id == item_id)
@@ -446,8 +687,86 @@ def get_inventory_report(item_id: Optional[int] = None, db: Session = Depends(ge
     ledger_entries = query.order_by(ItemLedger.movement_date.desc()).all()
     return ledger_entries
 
+# Analytics read the primary: results are cached until a write invalidates their range,
+# so a fill computed on a lagging replica would miss writes for the whole TTL
+@app.get("/api/reports/analytics/best-sellers", response_model=List[BestSellerResponse])
+def get_best_sellers(start_date: Optional[date] = None, end_date: Optional[date] = None, limit: int = 10, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return best_sellers(db, start_date, end_date, limit)
+
+@app.get("/api/reports/analytics/top-customers", response_model=List[TopCustomerResponse])
+def get_top_customers(start_date: Optional[date] = None, end_date: Optional[date] = None, limit: int = 10, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return top_customers(db, start_date, end_date, limit)
+
+@app.get("/api/reports/analytics/supplier-spend", response_model=List[SupplierSpendResponse])
+def get_supplier_spend(start_date: Optional[date] = None, end_date: Optional[date] = None, limit: int = 10, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return supplier_spend(db, start_date, end_date, limit)
+
+# ============================================
+# REPORT JOB ENDPOINTS
+# ============================================
+
+def get_report_job(job_id: str, current_user: User):
+    job = report_jobs.get(job_id)
+    if not job or (current_user.username not in job["requested_by"] and current_user.role != UserRole.ADMIN):
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+@app.post("/api/jobs/reports", response_model=ReportJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def create_report_job(job: ReportJobRequest, current_user: User = Depends(get_current_user)):
+    if job.kind not in REPORT_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(REPORT_KINDS)}")
+    if job.period not in (None, "day", "month"):
+        raise HTTPException(status_code=400, detail="period must be day or month")
+    return report_jobs.submit(job.kind, job.model_dump(exclude={"kind"}), current_user.username)
+
+@app.get("/api/jobs", response_model=List[ReportJobResponse])
+def list_report_jobs(current_user: User = Depends(get_current_user)):
+    return report_jobs.list(None if current_user.role == UserRole.ADMIN else current_user.username)
+
+@app.get("/api/jobs/{job_id}", response_model=ReportJobResponse)
+def get_report_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    return get_report_job(job_id, current_user)
+
+@app.get("/api/jobs/{job_id}/download")
+def download_report_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = get_report_job(job_id, current_user)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Report job is {job['status']}")
+    return FileResponse(job["path"], media_type="text/csv", filename=f"{job['kind']}-{job['created_at']:%Y%m%d-%H%M%S}.csv")
+
+@app.post("/api/reports/reconcile", response_model=ReconciliationResponse)
+def reconcile_inventory(fix: bool = False, full: bool = False, db: Session = Depends(get_db), current_user: User = Depends(get_admin_user)):
+    report = reconcile_stock(db, fix=fix, full=full)
+    print(f"✅ Reconciliation: {len(report['drift'])} items drifted, {report['corrections_written']} corrections written")
+    return report
+
+@app.get("/api/metrics")
+def get_metrics(current_user: User = Depends(get_admin_user)):
+    return {
+        "admission": admission.stats(),
+        "analytics_cache": analytics_cache.stats(),
+        "report_jobs": report_jobs.stats(),
+        "group_commit": group_committer.stats(),
+        "single_flight": single_flight.stats()
+    }
+
+@app.get("/api/profiles")
+def list_profiles(current_user: User = Depends(get_admin_user)):
+    return profiler.list_profiles()
+
+@app.get("/api/profiles/{profile_id}")
+def download_profile(profile_id: str, format: str = "folded", current_user: User = Depends(get_admin_user)):
+    # folded: collapsed stacks for flamegraph.pl / speedscope, json: timings and SQL statements
+    if format not in ("folded", "json"):
+        raise HTTPException(status_code=400, detail="format must be folded or json")
+    path = profiler.profile_path(profile_id, format)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "application/json" if format == "json" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=f"{profile_id}.{format}")
+
 @app.get("/api/reports/dashboard", response_model=DashboardResponse)
-def get_dashboard_data(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_dashboard_data(db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)):
     # Calculate totals
     total_sales = db.query(func.sum(SalesMaster.total_amount)).scalar() or 0.0
     total_purchases = db.query(func.sum(PurchaseMaster.total_amount)).scalar() or 0.0
@@ -475,6 +794,9 @@ def get_dashboard_data(db: Session = Depends(get_db), current_user: User = Depen
         "cashflow_data": [{"date": str(c.transaction_date), "type": c.type.value, "amount": float(c.amount)} for c in cashflow_data]
     }
 
+# Must run after every route is registered
+profiler.install(app, [engine, read_engine])
+
 if __name__ == "__main__":
     import uvicorn
     print("\n" + "="*50)
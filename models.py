@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -90,6 +90,12 @@ class PurchaseMaster(Base):
     # Relationships
     supplier = relationship("Supplier", back_populates="purchases")
     details = relationship("PurchaseDetail", back_populates="purchase", cascade="all, delete-orphan")
+    
+    # Covers supplier spend analytics over a date range
+    __table_args__ = (
+        Index("ix_purchase_master_date_supplier_total", "purchase_date", "supplier_id", "total_amount"),
+        Index("ix_purchase_master_supplier_date", "supplier_id", "purchase_date"),
+    )
 
 class PurchaseDetail(Base):
     __tablename__ = "purchase_details"
@@ -118,6 +124,12 @@ class SalesMaster(Base):
     # Relationships
     customer = relationship("Customer", back_populates="sales")
     details = relationship("SalesDetail", back_populates="sales", cascade="all, delete-orphan")
+    
+    # Covers top customer analytics and the date filter of best sellers
+    __table_args__ = (
+        Index("ix_sales_master_date_customer_total", "sales_date", "customer_id", "total_amount"),
+        Index("ix_sales_master_customer_date", "customer_id", "sales_date"),
+    )
 
 class SalesDetail(Base):
     __tablename__ = "sales_details"
@@ -131,6 +143,11 @@ class SalesDetail(Base):
     # Relationships
     sales = relationship("SalesMaster", back_populates="details")
     item = relationship("Item", back_populates="sales_details")
+    
+    # Covers the best seller GROUP BY joined from sales_master
+    __table_args__ = (
+        Index("ix_sales_details_sales_item_qty_rate", "sales_id", "item_id", "quantity", "rate"),
+    )
 
 class CashFlow(Base):
     __tablename__ = "cash_flow"
@@ -157,4 +174,58 @@ class ItemLedger(Base):
     
     # Relationships
     item = relationship("Item", back_populates="ledger_entries")
+    
+    # Covers the per-item balance GROUP BY used by stock reconciliation
+    __table_args__ = (
+        Index("ix_item_ledger_item_type_qty", "item_id", "movement_type", "quantity"),
+    )
+
+class LedgerBalance(Base):
+    __tablename__ = "ledger_balances"
+    
+    # Running SUM of item_ledger movements per item, up to last_ledger_id
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+    balance = Column(Float, nullable=False, default=0.0)
+    last_ledger_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ItemStockSlot(Base):
+    __tablename__ = "item_stock_slots"
+    
+    # Optional split of items.current_stock for hot items: a sale decrements one
+    # slot row instead of the shared items row, and the stock is the SUM of slots
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    slot = Column(Integer, nullable=False)
+    quantity = Column(Float, nullable=False, default=0.0)
+    
+    __table_args__ = (
+        UniqueConstraint("item_id", "slot", name="uq_item_stock_slots_item_slot"),
+    )
 
+class SyncedSale(Base):
+    __tablename__ = "synced_sales"
+    
+    # Client-generated ids of sales uploaded by terminals, so retried batches are not applied twice
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    client_id = Column(String(64), unique=True, nullable=False)
+    sales_id = Column(Integer, ForeignKey("sales_master.id"), nullable=False)
+    terminal_id = Column(String(50))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PartyBalanceCheckpoint(Base):
+    __tablename__ = "party_balance_checkpoints"
+    
+    # Closing balance of a customer (sales) or supplier (purchases) at a month end,
+    # so statements start from the nearest checkpoint instead of the full history
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    party_type = Column(String(20), nullable=False)  # customer or supplier
+    party_id = Column(Integer, nullable=False)
+    period_end = Column(Date, nullable=False)
+    balance = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("party_type", "party_id", "period_end", name="uq_party_balance_checkpoints_party_period"),
+    )
@@ -0,0 +1,242 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from auth import verify_token
+
+# On-demand request profiling.
+#
+# A request is profiled when an admin sends "X-Profile: 1", or at random with
+# PROFILE_SAMPLE_RATE. While it runs, a sampler thread records the stack of the
+# worker thread executing its endpoint every PROFILE_SAMPLE_INTERVAL seconds,
+# and SQLAlchemy events record every statement it issues. The result is written
+# to PROFILE_DIR as collapsed stacks (<id>.folded, the input format of
+# flamegraph.pl and speedscope) plus <id>.json with timings and SQL; only the
+# newest PROFILE_MAX_FILES profiles are kept.
+#
+# With no profiled request in flight no hooks are installed: the only cost is
+# a context variable lookup per endpoint call.
+
+PROFILE_HEADER = "x-profile"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.002"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_STATEMENTS = 1000
+
+_current = contextvars.ContextVar("current_profile", default=None)
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.threads = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.statements = []
+        self.lock = threading.Lock()
+
+class Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = set()
+        self._engines = []
+        self._sampler = None
+
+    # ---- request lifecycle ----
+
+    def _should_profile(self, request):
+        if request.headers.get(PROFILE_HEADER) == "1":
+            authorization = request.headers.get("authorization", "")
+            payload = verify_token(authorization[7:]) if authorization.lower().startswith("bearer ") else None
+            if payload and payload.get("role") == "admin":
+                return "header"
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, request, call_next):
+        trigger = self._should_profile(request) if request.url.path.startswith("/api/") else None
+        if trigger is None:
+            return await call_next(request)
+
+        profile = RequestProfile(request.method, request.url.path, trigger)
+        self._start(profile)
+        token = _current.set(profile)
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            response.headers["X-Profile-Id"] = profile.id
+            return response
+        finally:
+            _current.reset(token)
+            self._stop(profile)
+            self._save(profile, time.perf_counter() - started, status_code)
+
+    def _start(self, profile: RequestProfile):
+        with self._lock:
+            if not self._active:
+                for engine in self._engines:
+                    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+                    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            self._active.add(profile)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+                self._sampler.start()
+
+    def _stop(self, profile: RequestProfile):
+        with self._lock:
+            self._active.discard(profile)
+            if not self._active:
+                for engine in self._engines:
+                    event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+                    event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = list(self._active)
+            frames = sys._current_frames()
+            for profile in active:
+                with profile.lock:
+                    threads = list(profile.threads)
+                for ident in threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        with profile.lock:
+                            profile.stacks[_fold(frame)] += 1
+                            profile.samples += 1
+            time.sleep(PROFILE_SAMPLE_INTERVAL)
+
+    # ---- storage ----
+
+    def _save(self, profile: RequestProfile, duration: float, status_code: int):
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"{profile.id}.folded"), "w") as f:
+                for stack, count in profile.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            meta = {
+                "id": profile.id,
+                "method": profile.method,
+                "path": profile.path,
+                "trigger": profile.trigger,
+                "started_at": profile.started_at.isoformat(),
+                "duration_ms": round(duration * 1000, 3),
+                "status_code": status_code,
+                "samples": profile.samples,
+                "sample_interval_ms": PROFILE_SAMPLE_INTERVAL * 1000,
+                "sql_count": len(profile.statements),
+                "sql_ms": round(sum(s["duration_ms"] for s in profile.statements), 3),
+                "sql": profile.statements
+            }
+            with open(os.path.join(PROFILE_DIR, f"{profile.id}.json"), "w") as f:
+                json.dump(meta, f, indent=2, default=str)
+            self._trim()
+        except OSError as e:
+            print(f"❌ Could not save profile {profile.id}: {str(e)}")
+
+    def _trim(self):
+        metas = sorted(
+            (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".json")),
+            key=os.path.getmtime
+        )
+        for path in metas[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else metas:
+            for stale in (path, path[:-len(".json")] + ".folded"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+    def list_profiles(self) -> list:
+        if not os.path.isdir(PROFILE_DIR):
+            return []
+        profiles = []
+        for name in os.listdir(PROFILE_DIR):
+            if name.endswith(".json"):
+                with open(os.path.join(PROFILE_DIR, name)) as f:
+                    meta = json.load(f)
+                meta.pop("sql", None)
+                profiles.append(meta)
+        return sorted(profiles, key=lambda p: p["started_at"], reverse=True)
+
+    def profile_path(self, profile_id: str, kind: str):
+        """Path of a stored profile file ("folded" or "json"), or None"""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(PROFILE_DIR, f"{profile_id}.{kind}")
+        return path if os.path.exists(path) else None
+
+    # ---- wiring ----
+
+    def install(self, app, engines):
+        """Hook the sync endpoints of app and the SQL of engines"""
+        self._engines = list({id(e): e for e in engines}.values())
+        for route in app.routes:
+            if isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.dependant.call):
+                route.dependant.call = _track_thread(route.dependant.call)
+
+def _track_thread(call):
+    # Sync endpoints run in a worker thread; register it with the request's profile
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        ident = threading.get_ident()
+        with profile.lock:
+            profile.threads.add(ident)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            with profile.lock:
+                profile.threads.discard(ident)
+    return wrapper
+
+def _fold(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None:
+        return
+    started = conn.info.get("profile_started")
+    duration = time.perf_counter() - started.pop() if started else 0.0
+    with profile.lock:
+        if len(profile.statements) < PROFILE_MAX_STATEMENTS:
+            profile.statements.append({
+                "statement": statement,
+                "executemany": executemany,
+                "duration_ms": round(duration * 1000, 3)
+            })
+
+profiler = Profiler()
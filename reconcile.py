@@ -0,0 +1,144 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+
+from models import Item, ItemLedger, LedgerBalance, MovementType
+from stock_slots import stock_levels
+
+# Stock reconciliation between items.current_stock and the item_ledger.
+#
+# Ledger balances are aggregated with one grouped query and saved in
+# ledger_balances together with the last ledger id they cover, so later runs
+# only aggregate the rows added since then. Everything is read with plain
+# SELECTs inside one transaction (a consistent snapshot on InnoDB), so
+# checkout is never blocked by a reconciliation run.
+#
+# Auto-increment ids can commit out of order, so the saved watermark only
+# advances over ledger rows older than LEDGER_SETTLE_SECONDS. Newer rows are
+# still counted when checking drift, they are just not saved yet.
+
+TOLERANCE = 1e-6
+LEDGER_SETTLE_SECONDS = 60
+
+def reconcile_stock(db: Session, fix: bool = False, full: bool = False) -> dict:
+    """Compare current stock with ledger balances and optionally write corrections"""
+    watermark = 0
+    if not full:
+        watermark = db.query(func.max(LedgerBalance.last_ledger_id)).scalar() or 0
+    settled_before = datetime.utcnow() - timedelta(seconds=LEDGER_SETTLE_SECONDS)
+    # created_at has no index: walk the primary key back from the tail and stop at
+    # the first settled row (MAX() with this filter would scan the whole ledger)
+    newest_settled = db.query(ItemLedger.id).filter(
+        ItemLedger.id > watermark,
+        ItemLedger.created_at <= settled_before
+    ).order_by(ItemLedger.id.desc()).limit(1).scalar()
+    high = max(newest_settled or 0, watermark)
+
+    # Net movement per item since the watermark, in a single grouped query
+    deltas = _ledger_movements(db, ItemLedger.id > watermark, ItemLedger.id <= high)
+    recent = _ledger_movements(db, ItemLedger.id > high)
+
+    if full:
+        db.query(LedgerBalance).delete(synchronize_session=False)
+        balances = {}
+    else:
+        balances = dict(db.query(LedgerBalance.item_id, LedgerBalance.balance).all())
+
+    rows_scanned = 0
+    inserts, updates = [], []
+    for item_id, delta, count in deltas:
+        rows_scanned += count
+        if item_id in balances:
+            balances[item_id] += delta or 0.0
+            updates.append({"item_id": item_id, "balance": balances[item_id], "last_ledger_id": high})
+        else:
+            balances[item_id] = delta or 0.0
+            inserts.append({"item_id": item_id, "balance": balances[item_id], "last_ledger_id": high})
+
+    # Keep one watermark for all rows so the next run starts from the same place
+    db.query(LedgerBalance).filter(LedgerBalance.last_ledger_id < high).update(
+        {LedgerBalance.last_ledger_id: high}, synchronize_session=False
+    )
+    if updates:
+        db.bulk_update_mappings(LedgerBalance, updates)
+    if inserts:
+        db.bulk_insert_mappings(LedgerBalance, inserts)
+
+    for item_id, delta, count in recent:
+        rows_scanned += count
+    recent = {item_id: delta or 0.0 for item_id, delta, _ in recent}
+
+    drift = []
+    items = db.query(Item.id, Item.name, Item.current_stock).all()
+    sharded = stock_levels(db)
+    for item_id, name, current_stock in items:
+        current_stock = sharded.get(item_id, current_stock)
+        ledger_balance = balances.get(item_id, 0.0) + recent.get(item_id, 0.0)
+        difference = (current_stock or 0.0) - ledger_balance
+        if abs(difference) > TOLERANCE:
+            drift.append({
+                "item_id": item_id,
+                "name": name,
+                "current_stock": current_stock or 0.0,
+                "ledger_balance": ledger_balance,
+                "difference": difference
+            })
+
+    corrections = 0
+    if fix and drift:
+        # Stock is what the tills sell from, so the ledger is brought in line with it.
+        # These rows sit above the watermark and are saved by a later run.
+        today = date.today()
+        db.bulk_insert_mappings(ItemLedger, [{
+            "item_id": d["item_id"],
+            "movement_date": today,
+            "movement_type": MovementType.IN if d["difference"] > 0 else MovementType.OUT,
+            "quantity": abs(d["difference"]),
+            "movement_reference": f"RECONCILE-{today.isoformat()}"
+        } for d in drift])
+        corrections = len(drift)
+
+    db.commit()
+    return {
+        "checked_items": len(items),
+        "ledger_rows_scanned": rows_scanned,
+        "watermark": high,
+        "full": full,
+        "drift": drift,
+        "corrections_written": corrections
+    }
+
+def _ledger_movements(db: Session, *criteria):
+    signed_quantity = case(
+        (ItemLedger.movement_type == MovementType.IN, ItemLedger.quantity),
+        else_=-ItemLedger.quantity
+    )
+    return db.query(
+        ItemLedger.item_id,
+        func.sum(signed_quantity),
+        func.count(ItemLedger.id)
+    ).filter(*criteria).group_by(ItemLedger.item_id).all()
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal, engine, Base
+
+    parser = argparse.ArgumentParser(description="Reconcile item stock with the item ledger")
+    parser.add_argument("--fix", action="store_true", help="write correcting ledger entries")
+    parser.add_argument("--full", action="store_true", help="ignore the saved watermark and rebuild balances")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        report = reconcile_stock(db, fix=args.fix, full=args.full)
+    finally:
+        db.close()
+
+    print(f"Checked {report['checked_items']} items, scanned {report['ledger_rows_scanned']} ledger rows "
+          f"(watermark {report['watermark']})")
+    for d in report["drift"]:
+        print(f"  Item {d['item_id']} {d['name']}: stock {d['current_stock']} "
+              f"ledger {d['ledger_balance']} difference {d['difference']:+}")
+    if args.fix:
+        print(f"Corrections written: {report['corrections_written']}")
@@ -0,0 +1,272 @@
+import csv
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import func
+
+# Background jobs for long-running reports.
+#
+# A report request returns a job id right away; the report itself runs in a
+# process pool against the read path (the replica when it is healthy) and is
+# written to REPORT_DIR as a CSV file that can be downloaded once the job is
+# done. Identical requests submitted while a job is still queued or running
+# share that job instead of starting another one.
+#
+# Workers are started with "spawn", not forked from the threaded API process,
+# so they cannot inherit a lock some other thread held at fork time. A worker
+# that dies (killed for memory, say) breaks the whole pool; the next submit
+# replaces it.
+
+REPORT_DIR = os.getenv("REPORT_DIR", "reports")
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_MAX_JOBS = 1000  # finished jobs kept in memory
+STREAM_BATCH_ROWS = 5000
+
+REPORT_KINDS = ("inventory_ledger", "stock_valuation", "period_summary")
+
+# ============================================
+# REPORTS (run in the worker processes)
+# ============================================
+
+def _read_session():
+    from database import SessionLocal, ReadSessionLocal, use_replica
+    return ReadSessionLocal() if use_replica() else SessionLocal()
+
+def _inventory_ledger(db, writer, params):
+    from models import ItemLedger, Item
+    writer.writerow(["movement_date", "item_id", "item_name", "movement_type", "quantity", "reference"])
+    query = db.query(
+        ItemLedger.movement_date, ItemLedger.item_id, Item.name,
+        ItemLedger.movement_type, ItemLedger.quantity, ItemLedger.movement_reference
+    ).join(Item, Item.id == ItemLedger.item_id)
+    if params.get("item_id"):
+        query = query.filter(ItemLedger.item_id == params["item_id"])
+    if params.get("start_date"):
+        query = query.filter(ItemLedger.movement_date >= params["start_date"])
+    if params.get("end_date"):
+        query = query.filter(ItemLedger.movement_date <= params["end_date"])
+    rows = 0
+    # Stream with a server-side cursor instead of loading the ledger in memory
+    for row in query.order_by(ItemLedger.movement_date.desc(), ItemLedger.id.desc()).yield_per(STREAM_BATCH_ROWS):
+        writer.writerow([row[0], row[1], row[2], row[3].value, row[4], row[5] or ""])
+        rows += 1
+    return rows
+
+def _stock_valuation(db, writer, params):
+    from models import Item, PurchaseDetail
+    from stock_slots import stock_levels
+    writer.writerow(["item_id", "item_name", "unit_of_measure", "current_stock", "average_cost", "stock_value"])
+    # Weighted average purchase cost per item in one grouped query
+    costs = dict(db.query(
+        PurchaseDetail.item_id,
+        func.sum(PurchaseDetail.quantity * PurchaseDetail.rate) / func.nullif(func.sum(PurchaseDetail.quantity), 0)
+    ).group_by(PurchaseDetail.item_id).all())
+    sharded = stock_levels(db)
+    rows = 0
+    for item in db.query(Item.id, Item.name, Item.unit_of_measure, Item.current_stock).order_by(Item.id).yield_per(STREAM_BATCH_ROWS):
+        stock = sharded.get(item.id, item.current_stock or 0.0)
+        cost = float(costs.get(item.id) or 0.0)
+        writer.writerow([item.id, item.name, item.unit_of_measure or "", stock, round(cost, 4), round(stock * cost, 2)])
+        rows += 1
+    return rows
+
+def _period_summary(db, writer, params):
+    from models import SalesMaster, PurchaseMaster, CashFlow, CashFlowType
+    period = params.get("period") or "day"
+    start, end = params.get("start_date"), params.get("end_date")
+
+    def bucket(day):
+        return day.strftime("%Y-%m") if period == "month" else day.isoformat()
+
+    def daily(date_column, amount_column, *criteria):
+        query = db.query(date_column, func.sum(amount_column), func.count()).filter(*criteria)
+        if start:
+            query = query.filter(date_column >= start)
+        if end:
+            query = query.filter(date_column <= end)
+        return query.group_by(date_column).all()
+
+    totals = defaultdict(lambda: defaultdict(float))
+    for day, amount, count in daily(SalesMaster.sales_date, SalesMaster.total_amount):
+        totals[bucket(day)]["sales"] += amount or 0.0
+        totals[bucket(day)]["sales_count"] += count
+    for day, amount, count in daily(PurchaseMaster.purchase_date, PurchaseMaster.total_amount):
+        totals[bucket(day)]["purchases"] += amount or 0.0
+        totals[bucket(day)]["purchase_count"] += count
+    for day, amount, _ in daily(CashFlow.transaction_date, CashFlow.amount, CashFlow.type == CashFlowType.IN):
+        totals[bucket(day)]["cash_in"] += amount or 0.0
+    for day, amount, _ in daily(CashFlow.transaction_date, CashFlow.amount, CashFlow.type == CashFlowType.OUT):
+        totals[bucket(day)]["cash_out"] += amount or 0.0
+
+    writer.writerow(["period", "sales", "sales_count", "purchases", "purchase_count", "cash_in", "cash_out", "net_cashflow"])
+    for key in sorted(totals):
+        t = totals[key]
+        writer.writerow([key, round(t["sales"], 2), int(t["sales_count"]), round(t["purchases"], 2),
+                         int(t["purchase_count"]), round(t["cash_in"], 2), round(t["cash_out"], 2),
+                         round(t["cash_in"] - t["cash_out"], 2)])
+    return len(totals)
+
+_REPORTS = {
+    "inventory_ledger": _inventory_ledger,
+    "stock_valuation": _stock_valuation,
+    "period_summary": _period_summary
+}
+
+def run_report(kind: str, params: dict, path: str) -> int:
+    """Write one report to path as CSV; returns the number of data rows"""
+    params = {k: date.fromisoformat(v) if k.endswith("_date") and v else v for k, v in params.items()}
+    tmp_path = path + ".tmp"
+    db = _read_session()
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            rows = _REPORTS[kind](db, csv.writer(f), params)
+    finally:
+        db.close()
+    os.replace(tmp_path, path)
+    return rows
+
+# ============================================
+# JOB TRACKING (request process)
+# ============================================
+
+class ReportJobs:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending = {}  # dedup key -> job id of a queued or running job
+        self._futures = {}
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.deduplicated = 0
+        self.pool_restarts = 0
+
+    def _pool(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=REPORT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _run_in_pool(self, *args):
+        executor = self._pool()
+        try:
+            return executor.submit(run_report, *args)
+        except BrokenProcessPool:
+            # A worker died and took the pool with it: replace the pool once and retry
+            with self._executor_lock:
+                if self._executor is executor:
+                    self._executor = None
+                    self.pool_restarts += 1
+            executor.shutdown(wait=False)
+            print("⚠️ Report worker pool was broken, starting a new one")
+            return self._pool().submit(run_report, *args)
+
+    def submit(self, kind: str, params: dict, username: str) -> dict:
+        params = {k: (v.isoformat() if isinstance(v, date) else v) for k, v in params.items() if v is not None}
+        key = json.dumps([kind, params], sort_keys=True)
+        with self._lock:
+            job_id = self._pending.get(key)
+            if job_id is not None:
+                # Shared job: every requester may poll and download it
+                job = self._jobs[job_id]
+                if username not in job["requested_by"]:
+                    job["requested_by"].append(username)
+                self.deduplicated += 1
+                return self._snapshot(job)
+
+            job_id = uuid.uuid4().hex
+            os.makedirs(REPORT_DIR, exist_ok=True)
+            job = {
+                "id": job_id,
+                "kind": kind,
+                "params": params,
+                "status": "queued",
+                "created_by": username,
+                "requested_by": [username],
+                "created_at": datetime.utcnow(),
+                "finished_at": None,
+                "rows": None,
+                "error": None,
+                "path": os.path.join(REPORT_DIR, f"{kind}-{job_id}.csv")
+            }
+            self._jobs[job_id] = job
+            self._pending[key] = job_id
+            self._trim()
+
+        try:
+            future = self._run_in_pool(kind, params, job["path"])
+        except Exception as e:
+            # Not queued after all: fail the job so identical requests do not attach to it
+            with self._lock:
+                self._pending.pop(key, None)
+                job["status"] = "failed"
+                job["error"] = str(e)
+                job["finished_at"] = datetime.utcnow()
+            print(f"❌ Report job {job_id} could not be queued: {str(e)}")
+            return dict(job)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, key, f))
+        return dict(job)
+
+    def _finish(self, job_id: str, key: str, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            self._pending.pop(key, None)
+            self._futures.pop(job_id, None)
+            if job is None:
+                return
+            job["finished_at"] = datetime.utcnow()
+            error = future.exception()
+            if error is None:
+                job["status"] = "done"
+                job["rows"] = future.result()
+            else:
+                job["status"] = "failed"
+                job["error"] = str(error)
+        if error is not None:
+            print(f"❌ Report job {job_id} failed: {str(error)}")
+
+    def _trim(self):
+        finished = [j for j in self._jobs.values() if j["status"] in ("done", "failed")]
+        for job in sorted(finished, key=lambda j: j["created_at"])[:max(len(self._jobs) - REPORT_MAX_JOBS, 0)]:
+            del self._jobs[job["id"]]
+            if os.path.exists(job["path"]):
+                os.remove(job["path"])
+
+    def _snapshot(self, job: dict) -> dict:
+        # A queued job becomes running once a worker process picks it up
+        future = self._futures.get(job["id"])
+        if job["status"] == "queued" and future is not None and future.running():
+            job["status"] = "running"
+        return dict(job, requested_by=list(job["requested_by"]))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def list(self, username: Optional[str] = None) -> list:
+        with self._lock:
+            jobs = [self._snapshot(j) for j in self._jobs.values() if username is None or username in j["requested_by"]]
+        return sorted(jobs, key=lambda j: j["created_at"], reverse=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_status = defaultdict(int)
+            for job in self._jobs.values():
+                by_status[self._snapshot(job)["status"]] += 1
+            return {"jobs": dict(by_status), "deduplicated": self.deduplicated, "workers": REPORT_WORKERS,
+                    "pool_restarts": self.pool_restarts}
+
+report_jobs = ReportJobs()
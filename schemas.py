@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from datetime import date, datetime
 from models import UserRole, Status, MovementType, CashFlowType
@@ -212,3 +212,96 @@ class DashboardResponse(BaseModel):
     purchase_data: List[dict]
     cashflow_data: List[dict]
 
+
+# Stock Reconciliation Schemas
+class StockDriftResponse(BaseModel):
+    item_id: int
+    name: str
+    current_stock: float
+    ledger_balance: float
+    difference: float
+
+class ReconciliationResponse(BaseModel):
+    checked_items: int
+    ledger_rows_scanned: int
+    watermark: int
+    full: bool
+    drift: List[StockDriftResponse]
+    corrections_written: int
+
+# Analytics Schemas
+class BestSellerResponse(BaseModel):
+    item_id: int
+    name: str
+    quantity: float
+    revenue: float
+
+class TopCustomerResponse(BaseModel):
+    customer_id: int
+    name: str
+    sales_count: int
+    revenue: float
+
+class SupplierSpendResponse(BaseModel):
+    supplier_id: int
+    name: str
+    purchase_count: int
+    spend: float
+
+# Terminal Sync Schemas
+# Lengths match the synced_sales columns
+class SyncSale(SalesMasterBase):
+    client_id: str = Field(..., min_length=1, max_length=64)
+
+class SalesSyncRequest(BaseModel):
+    terminal_id: Optional[str] = Field(None, max_length=50)
+    sales: List[SyncSale]
+
+class SyncResult(BaseModel):
+    client_id: str
+    status: str  # accepted, duplicate or rejected
+    sales_id: Optional[int] = None
+    sale: Optional[SalesMasterResponse] = None
+    detail: Optional[str] = None
+
+class SalesSyncResponse(BaseModel):
+    results: List[SyncResult]
+
+# Report Job Schemas
+class ReportJobRequest(BaseModel):
+    kind: str  # inventory_ledger, stock_valuation or period_summary
+    item_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    period: Optional[str] = None  # day or month, for period_summary
+
+class ReportJobResponse(BaseModel):
+    id: str
+    kind: str
+    params: dict
+    status: str  # queued, running, done or failed
+    created_by: str
+    requested_by: List[str]  # everyone who asked for this report while it was pending
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    rows: Optional[int] = None
+    error: Optional[str] = None
+
+# Statement Schemas
+class StatementLine(BaseModel):
+    id: int  # sales or purchase id
+    transaction_date: date
+    reference: str
+    amount: float
+    balance: float
+
+class StatementResponse(BaseModel):
+    party_id: int
+    name: str
+    start_date: date
+    end_date: date
+    opening_balance: float
+    total: float
+    closing_balance: float
+    transaction_count: int
+    lines: List[StatementLine]
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import time
+
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from auth import verify_token
+from database import SessionLocal, last_write, use_replica
+from models import User
+
+# Single-flight for hot read endpoints.
+#
+# When many terminals request the same list at once (shift start), only the
+# first request runs the endpoint; identical requests that arrive while it is
+# in flight wait for it and get a copy of its serialized response. Requests are
+# identical when they share the route, the query parameters, the caller's role
+# and the database they read (replica or primary). With SINGLE_FLIGHT_TTL > 0 a response is also reused for that many
+# seconds, and any successful write through the API drops those copies.
+#
+# Only 200 responses are shared; when the leader fails, each waiting request
+# runs on its own. A client never gets a response whose query started before
+# its own last write, and a client pinned to the primary after a write never
+# gets one read from the replica, so it always reads what it just wrote.
+# Shared and cached responses skip get_current_user, so the caller's user is
+# looked up here instead (at most every USER_CHECK_SECONDS per user): a deleted
+# user's still-valid token gets its 401 from the endpoint.
+
+SINGLE_FLIGHT_ROUTES = {
+    route.strip()
+    for route in os.getenv("SINGLE_FLIGHT_ROUTES", "/api/items,/api/customers,/api/reports/dashboard").split(",")
+    if route.strip()
+}
+SINGLE_FLIGHT_TTL = float(os.getenv("SINGLE_FLIGHT_TTL", "0"))
+SINGLE_FLIGHT_MAX_CACHED = 1000
+USER_CHECK_SECONDS = 5
+# Per-request headers that must not be copied to other callers
+_PRIVATE_HEADERS = {"x-profile-id"}
+
+class SingleFlight:
+    def __init__(self):
+        # Only touched from the event loop, so no lock is needed
+        self._in_flight = {}
+        self._cached = {}
+        self._invalidated_at = 0.0
+        self._users_checked = {}  # username -> monotonic time the user was last found
+        self.requests = 0
+        self.executed = 0
+        self.shared = 0
+        self.cache_hits = 0
+        self.fallbacks = 0
+
+    def _payload(self, request):
+        authorization = request.headers.get("authorization", "")
+        return verify_token(authorization[7:]) if authorization.lower().startswith("bearer ") else None
+
+    async def _user_exists(self, username) -> bool:
+        checked = self._users_checked.get(username)
+        if checked is not None and time.monotonic() - checked < USER_CHECK_SECONDS:
+            return True
+        if not await run_in_threadpool(_find_user, username):
+            self._users_checked.pop(username, None)
+            return False
+        if len(self._users_checked) >= 10000:
+            self._users_checked.clear()
+        self._users_checked[username] = time.monotonic()
+        return True
+
+    async def __call__(self, request, call_next):
+        path = request.url.path
+        if request.method != "GET":
+            response = await call_next(request)
+            if path.startswith("/api/") and response.status_code < 400:
+                self._cached.clear()
+                self._invalidated_at = time.monotonic()
+            return response
+        if path not in SINGLE_FLIGHT_ROUTES:
+            return await call_next(request)
+        payload = self._payload(request)
+        if payload is None:
+            return await call_next(request)
+        key = (path, tuple(sorted(request.query_params.multi_items())), payload.get("role"))
+        self.requests += 1
+        # Same key as the read-after-write tracking in database.py
+        authorization = request.headers.get("authorization")
+        written_at = last_write(authorization) or 0.0
+        # Decide replica vs primary once; get_read_db follows request.state, so the
+        # query runs where the key says (the lag probe may block, keep it off the loop)
+        request.state.use_replica = await run_in_threadpool(use_replica, authorization)
+        key = key + (request.state.use_replica,)
+
+        cached = self._cached.get(key)
+        waiting = self._in_flight.get(key)
+        shareable = ((cached is not None and cached[0] > time.monotonic() and cached[1] >= written_at)
+                     or (waiting is not None and waiting[0] >= written_at))
+        if shareable and not await self._user_exists(payload.get("sub")):
+            # Let the endpoint reject it
+            return await call_next(request)
+
+        # Re-read: both may have changed while the user was looked up
+        cached = self._cached.get(key)
+        if cached is not None and cached[0] > time.monotonic() and cached[1] >= written_at:
+            self.cache_hits += 1
+            return _copy(cached[2], "cached")
+
+        waiting = self._in_flight.get(key)
+        if waiting is not None and waiting[0] >= written_at:
+            result = await asyncio.shield(waiting[1])
+            if result is not None:
+                self.shared += 1
+                return _copy(result, "shared")
+            self.fallbacks += 1
+            return await call_next(request)
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (started, future)
+        result = None
+        try:
+            self.executed += 1
+            response = await call_next(request)
+            if response.status_code != 200:
+                return response
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            headers = {k: v for k, v in response.headers.items() if k.lower() not in _PRIVATE_HEADERS}
+            result = (body, headers)
+            # Not cached when a write finished while the query ran
+            if SINGLE_FLIGHT_TTL > 0 and started >= self._invalidated_at:
+                if len(self._cached) >= SINGLE_FLIGHT_MAX_CACHED:
+                    self._cached.clear()
+                self._cached[key] = (time.monotonic() + SINGLE_FLIGHT_TTL, started, result)
+            return Response(content=body, status_code=200, headers=dict(response.headers))
+        finally:
+            if self._in_flight.get(key, (None, None))[1] is future:
+                del self._in_flight[key]
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        coalesced = self.shared + self.cache_hits
+        return {
+            "routes": sorted(SINGLE_FLIGHT_ROUTES),
+            "ttl_seconds": SINGLE_FLIGHT_TTL,
+            "requests": self.requests,
+            "executed": self.executed,
+            "shared": self.shared,
+            "cache_hits": self.cache_hits,
+            "fallbacks": self.fallbacks,
+            "coalescing_ratio": round(coalesced / self.requests, 4) if self.requests else 0.0,
+            "in_flight": len(self._in_flight)
+        }
+
+def _find_user(username) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(User.id).filter(User.username == username).first() is not None
+    finally:
+        db.close()
+
+def _copy(result, source: str) -> Response:
+    body, headers = result
+    response = Response(content=body, status_code=200, headers=headers)
+    response.headers["X-Single-Flight"] = source
+    return response
+
+single_flight = SingleFlight()
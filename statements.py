@@ -0,0 +1,176 @@
+import argparse
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Customer, Supplier, SalesMaster, PurchaseMaster, PartyBalanceCheckpoint
+
+# Customer and supplier statements with running balances.
+#
+# A party's balance is the running total of its sales (customers) or purchases
+# (suppliers). Month-end closing balances are stored in
+# party_balance_checkpoints, so a statement only reads the transactions between
+# the nearest checkpoint and its end date: the opening balance is that
+# checkpoint plus the few transactions after it, and the running balance of the
+# statement lines comes from a SUM() OVER window in the same query. Checkpoints
+# are only written for complete months; a backdated sale or purchase drops the
+# party's checkpoints from its date on and they are rebuilt on the next
+# statement.
+#
+# A statement request that builds checkpoints commits them on its own session,
+# so GET .../statement can write. The build reads the transactions with a
+# locking read and re-checks its starting checkpoint under a lock before it
+# inserts, taking the locks in the same order as a backdated write (transaction
+# rows, then checkpoints): a build racing such a write either waits for it and
+# sees its row, or finishes first and has its checkpoints dropped by it.
+
+PARTIES = {
+    # party type -> (party model, transaction model, party column, date column, reference prefix)
+    "customer": (Customer, SalesMaster, SalesMaster.customer_id, SalesMaster.sales_date, "SALES"),
+    "supplier": (Supplier, PurchaseMaster, PurchaseMaster.supplier_id, PurchaseMaster.purchase_date, "PURCHASE"),
+}
+
+def _month_end(day: date) -> date:
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+def _last_complete_month_end(today: Optional[date] = None) -> date:
+    return (today or date.today()).replace(day=1) - timedelta(days=1)
+
+def _period_total(db: Session, party_type: str, party_id: int, after: Optional[date], through: date) -> float:
+    _, model, party_column, date_column, _ = PARTIES[party_type]
+    query = db.query(func.sum(model.total_amount)).filter(party_column == party_id, date_column <= through)
+    if after is not None:
+        query = query.filter(date_column > after)
+    return float(query.scalar() or 0.0)
+
+def _latest_checkpoint(db: Session, party_type: str, party_id: int, before: Optional[date] = None, lock: bool = False):
+    query = db.query(PartyBalanceCheckpoint).filter(
+        PartyBalanceCheckpoint.party_type == party_type,
+        PartyBalanceCheckpoint.party_id == party_id
+    )
+    if before is not None:
+        query = query.filter(PartyBalanceCheckpoint.period_end < before)
+    if lock:
+        query = query.with_for_update(read=True)
+    return query.order_by(PartyBalanceCheckpoint.period_end.desc()).first()
+
+def build_checkpoints(db: Session, party_type: str, party_id: int, through: Optional[date] = None) -> int:
+    """Store month-end balances for the party up to through (default: last complete month); returns rows added"""
+    _, model, party_column, date_column, _ = PARTIES[party_type]
+    through = min(through or _last_complete_month_end(), _last_complete_month_end())
+    if through != _month_end(through):
+        # Checkpoints cover whole months only
+        through = through.replace(day=1) - timedelta(days=1)
+    latest = _latest_checkpoint(db, party_type, party_id)
+    if latest is not None and latest.period_end >= through:
+        return 0
+
+    balance = latest.balance if latest is not None else 0.0
+    # Locking read: waits for uncommitted writes in the range and reads the latest
+    # committed rows, not the transaction's snapshot
+    query = db.query(date_column, model.total_amount).filter(party_column == party_id, date_column <= through)
+    if latest is not None:
+        query = query.filter(date_column > latest.period_end)
+    rows = query.order_by(date_column).with_for_update(read=True).all()
+
+    # The starting checkpoint must still exist: a backdated write may have dropped it
+    current = _latest_checkpoint(db, party_type, party_id, lock=True)
+    if (current.id if current is not None else None) != (latest.id if latest is not None else None):
+        db.rollback()
+        return 0
+
+    # One checkpoint per month with activity, plus one at `through` to mark how far they go
+    closing = {}
+    for day, amount in rows:
+        balance += amount or 0.0
+        closing[_month_end(day)] = balance
+    closing.setdefault(_month_end(through), balance)
+
+    for period_end, period_balance in closing.items():
+        db.add(PartyBalanceCheckpoint(party_type=party_type, party_id=party_id, period_end=period_end, balance=period_balance))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request built the same checkpoints first
+        db.rollback()
+        return 0
+    return len(closing)
+
+def invalidate_checkpoints(db: Session, party_type: str, party_id: int, day: date):
+    """Drop checkpoints a transaction dated day would change; a no-op for current-month dates"""
+    if day > _last_complete_month_end():
+        return
+    db.query(PartyBalanceCheckpoint).filter(
+        PartyBalanceCheckpoint.party_type == party_type,
+        PartyBalanceCheckpoint.party_id == party_id,
+        PartyBalanceCheckpoint.period_end >= day
+    ).delete(synchronize_session=False)
+
+def opening_balance(db: Session, party_type: str, party_id: int, start: date) -> float:
+    """Balance before start, from the nearest earlier checkpoint plus the transactions since"""
+    build_checkpoints(db, party_type, party_id, start - timedelta(days=1))
+    checkpoint = _latest_checkpoint(db, party_type, party_id, before=start)
+    after = checkpoint.period_end if checkpoint is not None else None
+    base = checkpoint.balance if checkpoint is not None else 0.0
+    return base + _period_total(db, party_type, party_id, after, start - timedelta(days=1))
+
+def party_statement(db: Session, party_type: str, party_id: int, start: date, end: date) -> Optional[dict]:
+    """Statement of a customer or supplier between start and end; None when the party does not exist"""
+    party_model, model, party_column, date_column, prefix = PARTIES[party_type]
+    party = db.query(party_model).filter(party_model.id == party_id).first()
+    if party is None:
+        return None
+
+    opening = opening_balance(db, party_type, party_id, start)
+    running = func.sum(model.total_amount).over(order_by=[date_column, model.id])
+    rows = db.query(model.id, date_column, model.total_amount, running).filter(
+        party_column == party_id,
+        date_column >= start,
+        date_column <= end
+    ).order_by(date_column, model.id).all()
+
+    lines = [
+        {"id": row[0], "transaction_date": row[1], "reference": f"{prefix}-{row[0]}", "amount": row[2] or 0.0, "balance": opening + (row[3] or 0.0)}
+        for row in rows
+    ]
+    total = sum(line["amount"] for line in lines)
+    return {
+        "party_id": party.id,
+        "name": party.name,
+        "start_date": start,
+        "end_date": end,
+        "opening_balance": opening,
+        "total": total,
+        "closing_balance": opening + total,
+        "transaction_count": len(lines),
+        "lines": lines
+    }
+
+def build_all_checkpoints(db: Session, rebuild: bool = False) -> int:
+    """Bring the checkpoints of every customer and supplier up to the last complete month"""
+    if rebuild:
+        db.query(PartyBalanceCheckpoint).delete(synchronize_session=False)
+        db.commit()
+    added = 0
+    for party_type, (party_model, _, _, _, _) in PARTIES.items():
+        for (party_id,) in db.query(party_model.id).order_by(party_model.id).all():
+            added += build_checkpoints(db, party_type, party_id)
+    return added
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine, Base
+
+    parser = argparse.ArgumentParser(description="Build month-end balance checkpoints for statements")
+    parser.add_argument("--rebuild", action="store_true", help="drop all checkpoints and rebuild them")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(f"✅ Stored {build_all_checkpoints(db, rebuild=args.rebuild)} checkpoints")
+    finally:
+        db.close()
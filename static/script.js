@@ -3,6 +3,40 @@ let authToken = '';
 let currentUserRole = '';
 const API_BASE = 'http://localhost:8000/api';
 
+// In-memory tables: loaded once per session, then patched from the event stream
+const tables = {};
+const tableLoads = {};  // table name -> { promise, events buffered while it loads }
+const TABLE_ENDPOINTS = {
+    suppliers: '/suppliers',
+    customers: '/customers',
+    items: '/items',
+    purchases: '/purchases',
+    sales: '/sales',
+    cashflow: '/cashflow'
+};
+const TABLE_RENDERERS = {
+    suppliers: () => renderSuppliers(),
+    customers: () => renderCustomers(),
+    items: () => renderItems(),
+    purchases: () => renderPurchases(),
+    sales: () => renderSales(),
+    cashflow: () => renderCashFlow()
+};
+let eventSource = null;
+// Offline sales queue (IndexedDB), flushed to /sync/sales in batches
+const SALES_QUEUE_DB = 'posOfflineQueue';
+const SALES_QUEUE_STORE = 'pendingSales';
+const SALES_REJECTED_STORE = 'rejectedSales';  // sales the server refused, kept for review
+const SYNC_BATCH_SIZE = 50;
+const SYNC_FLUSH_DELAY_MS = 1000;
+const SYNC_RETRY_MS = 15000;
+const DASHBOARD_REFRESH_MS = 30000;  // open dashboards reload the totals at most this often
+let salesQueueDb = null;
+let syncTimer = null;
+let syncInFlight = false;
+let dashboardRefreshTimer = null;
+let currentModule = '';
+
 // Initialize
 document.addEventListener('DOMContentLoaded', function() {
     // Check if already logged in
@@ -24,6 +58,10 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('salesForm').addEventListener('submit', handleSalesSubmit);
     document.getElementById('cashFlowForm').addEventListener('submit', handleCashFlowSubmit);
     
+    // Upload queued sales whenever the network comes back
+    window.addEventListener('online', () => scheduleSalesSync(0));
+    setInterval(() => scheduleSalesSync(0), SYNC_RETRY_MS);
+    
     // Set today's date for date inputs
     const today = new Date().toISOString().split('T')[0];
     document.getElementById('purchaseDate').value = today;
@@ -97,6 +135,7 @@ async function handleLogin(e) {
 }
 
 function logout() {
+    disconnectEvents();
     authToken = '';
     currentUserRole = '';
     localStorage.removeItem('authToken');
@@ -109,11 +148,121 @@ function showMainApp() {
     document.getElementById('loginScreen').style.display = 'none';
     document.getElementById('mainApp').style.display = 'flex';
     document.getElementById('userRoleDisplay').textContent = `Role: ${currentUserRole}`;
+    connectEvents();
+    scheduleSalesSync(0);
     showModule('dashboard');
 }
 
+// Table cache
+async function getTable(name) {
+    if (!tables[name]) {
+        if (!tableLoads[name]) {
+            const load = { events: [] };
+            load.promise = loadTable(name, load);
+            tableLoads[name] = load;
+        }
+        await tableLoads[name].promise;
+    }
+    return tables[name] ? Array.from(tables[name].values()) : [];
+}
+
+async function loadTable(name, load) {
+    // Events that arrive while the list is being fetched are buffered and replayed
+    // on top of it, since the fetched rows may predate them
+    try {
+        const rows = await apiCall(TABLE_ENDPOINTS[name]);
+        if (rows && tableLoads[name] === load) {
+            const table = new Map(rows.map(r => [r.id, r]));
+            load.events.forEach(e => applyToTable(table, e.op, e.row));
+            tables[name] = table;
+        }
+    } finally {
+        if (tableLoads[name] === load) delete tableLoads[name];
+    }
+}
+
+function applyToTable(table, op, row) {
+    if (op === 'delete') {
+        table.delete(row.id);
+    } else {
+        table.set(row.id, row);
+    }
+}
+
+function getRow(name, id) {
+    return tables[name] ? tables[name].get(id) : undefined;
+}
+
+function upsertRow(name, row) {
+    if (!row) return;
+    if (tableLoads[name]) {
+        tableLoads[name].events.push({ op: 'upsert', row });
+        return;
+    }
+    if (!tables[name]) return;
+    tables[name].set(row.id, row);
+    refreshTable(name);
+}
+
+function deleteRow(name, id) {
+    if (tableLoads[name]) {
+        tableLoads[name].events.push({ op: 'delete', row: { id } });
+        return;
+    }
+    if (!tables[name]) return;
+    tables[name].delete(id);
+    refreshTable(name);
+}
+
+function refreshTable(name) {
+    if (currentModule === name) {
+        TABLE_RENDERERS[name]();
+    }
+}
+
+function resetTables() {
+    Object.keys(tables).forEach(name => delete tables[name]);
+    // In-flight loads may predate the reset; their results are discarded
+    Object.keys(tableLoads).forEach(name => delete tableLoads[name]);
+    if (currentModule) loadModuleData(currentModule);
+}
+
+// Push events
+function connectEvents() {
+    disconnectEvents();
+    eventSource = new EventSource(`${API_BASE}/events?token=${encodeURIComponent(authToken)}`);
+    eventSource.addEventListener('change', e => applyEvent(JSON.parse(e.data)));
+}
+
+function disconnectEvents() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+function applyEvent(event) {
+    if (event.op === 'reset') {
+        resetTables();
+    } else if (event.op === 'delete') {
+        deleteRow(event.table, event.row.id);
+    } else {
+        upsertRow(event.table, event.row);
+    }
+    if (currentModule === 'dashboard' && event.table !== 'suppliers' && event.table !== 'customers' && !dashboardRefreshTimer) {
+        // The dashboard is the heaviest report and sales arrive continuously:
+        // reload it once per DASHBOARD_REFRESH_MS, not after every sale
+        dashboardRefreshTimer = setTimeout(() => {
+            dashboardRefreshTimer = null;
+            if (currentModule === 'dashboard' && authToken) loadDashboard();
+        }, DASHBOARD_REFRESH_MS);
+    }
+}
+
 // Navigation
 function showModule(moduleName) {
+    currentModule = moduleName;
+    
     // Hide all modules
     document.querySelectorAll('.module').forEach(m => m.style.display = 'none');
     
@@ -244,9 +393,14 @@ function createCashFlowChart(data) {
 
 // Suppliers
 async function loadSuppliers() {
-    const suppliers = await apiCall('/suppliers');
-    if (!suppliers) return;
-    
+    await getTable('suppliers');
+    if (!tables.suppliers) return;  // Load failed or was discarded by a reset
+    renderSuppliers();
+}
+
+function renderSuppliers() {
+    if (!tables.suppliers) return;
+    const suppliers = Array.from(tables.suppliers.values());
     const tbody = document.getElementById('suppliersTableBody');
     tbody.innerHTML = suppliers.map(s => `
         <tr>
@@ -285,19 +439,14 @@ async function handleSupplierSubmit(e) {
         status: document.getElementById('supplierStatus').value
     };
     
-    if (id) {
-        await apiCall(`/suppliers/${id}`, 'PUT', data);
-    } else {
-        await apiCall('/suppliers', 'POST', data);
-    }
+    const saved = id ? await apiCall(`/suppliers/${id}`, 'PUT', data) : await apiCall('/suppliers', 'POST', data);
     
     closeSupplierModal();
-    loadSuppliers();
+    upsertRow('suppliers', saved);
 }
 
 async function editSupplier(id) {
-    const suppliers = await apiCall(`/suppliers`);
-    const s = suppliers.find(s => s.id === id);
+    const s = getRow('suppliers', id);
     if (s) {
         document.getElementById('supplierId').value = s.id;
         document.getElementById('supplierName').value = s.name;
@@ -311,16 +460,20 @@ async function editSupplier(id) {
 
 async function deleteSupplier(id) {
     if (confirm('Are you sure you want to delete this supplier?')) {
-        await apiCall(`/suppliers/${id}`, 'DELETE');
-        loadSuppliers();
+        if (await apiCall(`/suppliers/${id}`, 'DELETE')) deleteRow('suppliers', id);
     }
 }
 
 // Customers
 async function loadCustomers() {
-    const customers = await apiCall('/customers');
-    if (!customers) return;
-    
+    await getTable('customers');
+    if (!tables.customers) return;  // Load failed or was discarded by a reset
+    renderCustomers();
+}
+
+function renderCustomers() {
+    if (!tables.customers) return;
+    const customers = Array.from(tables.customers.values());
     const tbody = document.getElementById('customersTableBody');
     tbody.innerHTML = customers.map(c => `
         <tr>
@@ -359,19 +512,14 @@ async function handleCustomerSubmit(e) {
         status: document.getElementById('customerStatus').value
     };
     
-    if (id) {
-        await apiCall(`/customers/${id}`, 'PUT', data);
-    } else {
-        await apiCall('/customers', 'POST', data);
-    }
+    const saved = id ? await apiCall(`/customers/${id}`, 'PUT', data) : await apiCall('/customers', 'POST', data);
     
     closeCustomerModal();
-    loadCustomers();
+    upsertRow('customers', saved);
 }
 
 async function editCustomer(id) {
-    const customers = await apiCall(`/customers`);
-    const c = customers.find(c => c.id === id);
+    const c = getRow('customers', id);
     if (c) {
         document.getElementById('customerId').value = c.id;
         document.getElementById('customerName').value = c.name;
@@ -385,16 +533,20 @@ async function editCustomer(id) {
 
 async function deleteCustomer(id) {
     if (confirm('Are you sure you want to delete this customer?')) {
-        await apiCall(`/customers/${id}`, 'DELETE');
-        loadCustomers();
+        if (await apiCall(`/customers/${id}`, 'DELETE')) deleteRow('customers', id);
     }
 }
 
 // Items
 async function loadItems() {
-    const items = await apiCall('/items');
-    if (!items) return;
-    
+    await getTable('items');
+    if (!tables.items) return;  // Load failed or was discarded by a reset
+    renderItems();
+}
+
+function renderItems() {
+    if (!tables.items) return;
+    const items = Array.from(tables.items.values());
     const tbody = document.getElementById('itemsTableBody');
     tbody.innerHTML = items.map(i => `
         <tr>
@@ -430,19 +582,14 @@ async function handleItemSubmit(e) {
         current_stock: parseFloat(document.getElementById('itemStock').value)
     };
     
-    if (id) {
-        await apiCall(`/items/${id}`, 'PUT', data);
-    } else {
-        await apiCall('/items', 'POST', data);
-    }
+    const saved = id ? await apiCall(`/items/${id}`, 'PUT', data) : await apiCall('/items', 'POST', data);
     
     closeItemModal();
-    loadItems();
+    upsertRow('items', saved);
 }
 
 async function editItem(id) {
-    const items = await apiCall(`/items`);
-    const i = items.find(i => i.id === id);
+    const i = getRow('items', id);
     if (i) {
         document.getElementById('itemId').value = i.id;
         document.getElementById('itemName').value = i.name;
@@ -454,8 +601,7 @@ async function editItem(id) {
 
 async function deleteItem(id) {
     if (confirm('Are you sure you want to delete this item?')) {
-        await apiCall(`/items/${id}`, 'DELETE');
-        loadItems();
+        if (await apiCall(`/items/${id}`, 'DELETE')) deleteRow('items', id);
     }
 }
 
@@ -463,9 +609,14 @@ async function deleteItem(id) {
 let purchaseItems = [];
 
 async function loadPurchases() {
-    const purchases = await apiCall('/purchases');
-    if (!purchases) return;
-    
+    await getTable('purchases');
+    if (!tables.purchases) return;  // Load failed or was discarded by a reset
+    renderPurchases();
+}
+
+function renderPurchases() {
+    if (!tables.purchases) return;
+    const purchases = Array.from(tables.purchases.values());
     const tbody = document.getElementById('purchasesTableBody');
     tbody.innerHTML = purchases.map(p => `
         <tr>
@@ -493,8 +644,7 @@ function closePurchaseModal() {
 }
 
 async function loadSuppliersForPurchase() {
-    const suppliers = await apiCall('/suppliers');
-    if (!suppliers) return;
+    const suppliers = await getTable('suppliers');
     
     const select = document.getElementById('purchaseSupplier');
     select.innerHTML = '<option value="">Select Supplier</option>' + 
@@ -512,8 +662,7 @@ function removePurchaseItem(index) {
 }
 
 async function updatePurchaseItemsList() {
-    const items = await apiCall('/items');
-    if (!items) return;
+    const items = await getTable('items');
     
     const container = document.getElementById('purchaseItemsList');
     container.innerHTML = purchaseItems.map((item, index) => `
@@ -542,9 +691,9 @@ async function handlePurchaseSubmit(e) {
         details: purchaseItems.filter(item => item.item_id && item.quantity > 0 && item.rate > 0)
     };
     
-    await apiCall('/purchases', 'POST', data);
+    const saved = await apiCall('/purchases', 'POST', data);
     closePurchaseModal();
-    loadPurchases();
+    upsertRow('purchases', saved);
 }
 
 async function viewPurchase(id) {
@@ -558,9 +707,14 @@ async function viewPurchase(id) {
 let salesItems = [];
 
 async function loadSales() {
-    const sales = await apiCall('/sales');
-    if (!sales) return;
-    
+    await getTable('sales');
+    if (!tables.sales) return;  // Load failed or was discarded by a reset
+    renderSales();
+}
+
+function renderSales() {
+    if (!tables.sales) return;
+    const sales = Array.from(tables.sales.values());
     const tbody = document.getElementById('salesTableBody');
     tbody.innerHTML = sales.map(s => `
         <tr>
@@ -588,8 +742,7 @@ function closeSalesModal() {
 }
 
 async function loadCustomersForSales() {
-    const customers = await apiCall('/customers');
-    if (!customers) return;
+    const customers = await getTable('customers');
     
     const select = document.getElementById('salesCustomer');
     select.innerHTML = '<option value="">Select Customer</option>' + 
@@ -607,8 +760,7 @@ function removeSalesItem(index) {
 }
 
 async function updateSalesItemsList() {
-    const items = await apiCall('/items');
-    if (!items) return;
+    const items = await getTable('items');
     
     const container = document.getElementById('salesItemsList');
     container.innerHTML = salesItems.map((item, index) => `
@@ -632,14 +784,166 @@ function updateSalesTotal() {
 async function handleSalesSubmit(e) {
     e.preventDefault();
     const data = {
+        client_id: newClientId(),
         sales_date: document.getElementById('salesDate').value,
         customer_id: parseInt(document.getElementById('salesCustomer').value),
-        details: salesItems.filter(item => item.item_id && item.quantity > 0 && item.rate > 0)
+        details: salesItems
+            .filter(item => item.item_id && item.quantity > 0 && item.rate > 0)
+            .map(item => ({ ...item, item_id: parseInt(item.item_id) }))
     };
     
-    await apiCall('/sales', 'POST', data);
+    // Queue locally first so the till keeps selling while the server is unreachable
+    await enqueueSale(data);
     closeSalesModal();
-    loadSales();
+    scheduleSalesSync(SYNC_FLUSH_DELAY_MS);
+}
+
+// Offline Sales Queue
+function newClientId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+function terminalId() {
+    let id = localStorage.getItem('terminalId');
+    if (!id) {
+        id = newClientId().slice(0, 36);
+        localStorage.setItem('terminalId', id);
+    }
+    return id;
+}
+
+function openSalesQueue() {
+    if (salesQueueDb) return Promise.resolve(salesQueueDb);
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(SALES_QUEUE_DB, 2);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            if (!db.objectStoreNames.contains(SALES_QUEUE_STORE)) {
+                db.createObjectStore(SALES_QUEUE_STORE, { keyPath: 'client_id' });
+            }
+            if (!db.objectStoreNames.contains(SALES_REJECTED_STORE)) {
+                db.createObjectStore(SALES_REJECTED_STORE, { keyPath: 'client_id' });
+            }
+        };
+        request.onsuccess = () => {
+            salesQueueDb = request.result;
+            resolve(salesQueueDb);
+        };
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function salesQueueRequest(mode, action, storeName = SALES_QUEUE_STORE) {
+    const db = await openSalesQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(storeName, mode);
+        const request = action(tx.objectStore(storeName));
+        tx.oncomplete = () => resolve(request ? request.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+function enqueueSale(sale) {
+    return salesQueueRequest('readwrite', store => store.put({ ...sale, queued_at: Date.now() }));
+}
+
+function dequeueSales(clientIds) {
+    return salesQueueRequest('readwrite', store => {
+        clientIds.forEach(id => store.delete(id));
+        return null;
+    });
+}
+
+// Move sales out of the queue into the rejected store in one transaction,
+// so a sale is never lost between the two
+async function rejectSales(sales, reasons) {
+    const db = await openSalesQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction([SALES_QUEUE_STORE, SALES_REJECTED_STORE], 'readwrite');
+        const rejectedStore = tx.objectStore(SALES_REJECTED_STORE);
+        const queueStore = tx.objectStore(SALES_QUEUE_STORE);
+        sales.forEach(sale => {
+            rejectedStore.put({ ...sale, rejected_at: Date.now(), reason: reasons[sale.client_id] || '' });
+            queueStore.delete(sale.client_id);
+        });
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function syncErrorDetail(response) {
+    try {
+        const data = await response.json();
+        return typeof data.detail === 'string' ? data.detail : JSON.stringify(data.detail);
+    } catch (error) {
+        return `HTTP ${response.status}`;
+    }
+}
+
+function scheduleSalesSync(delay) {
+    if (!authToken) return;
+    clearTimeout(syncTimer);
+    syncTimer = setTimeout(flushSalesQueue, delay);
+}
+
+async function flushSalesQueue() {
+    if (syncInFlight || !authToken || !navigator.onLine) return;
+    syncInFlight = true;
+    try {
+        while (true) {
+            const queued = await salesQueueRequest('readonly', store => store.getAll());
+            if (!queued || queued.length === 0) break;
+            
+            const batch = queued.sort((a, b) => a.queued_at - b.queued_at).slice(0, SYNC_BATCH_SIZE);
+            const response = await fetch(`${API_BASE}/sync/sales`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Authorization': `Bearer ${authToken}`
+                },
+                body: JSON.stringify({
+                    terminal_id: terminalId(),
+                    sales: batch.map(({ queued_at, ...sale }) => sale)
+                })
+            });
+            if (response.status === 401) {
+                logout();
+                break;
+            }
+            if (response.status >= 400 && response.status < 500 && response.status !== 408 && response.status !== 429) {
+                // The server refused the batch itself; retrying it unchanged would fail
+                // forever and hold up every sale queued behind it
+                const detail = await syncErrorDetail(response);
+                await rejectSales(batch, Object.fromEntries(batch.map(sale => [sale.client_id, detail])));
+                alert(`${batch.length} queued sale(s) were rejected and kept on this terminal for review:\n${detail}`);
+                continue;
+            }
+            if (!response.ok) break;  // Server busy or failing: keep the queue and retry later
+            
+            const data = await response.json();
+            const rejected = data.results.filter(r => r.status === 'rejected');
+            data.results.forEach(r => {
+                if (r.sale) upsertRow('sales', r.sale);
+            });
+            // Every sale got a final answer; rejected ones are kept aside, not dropped
+            await dequeueSales(data.results.filter(r => r.status !== 'rejected').map(r => r.client_id));
+            if (rejected.length > 0) {
+                const rejectedIds = new Set(rejected.map(r => r.client_id));
+                await rejectSales(
+                    batch.filter(sale => rejectedIds.has(sale.client_id)),
+                    Object.fromEntries(rejected.map(r => [r.client_id, r.detail]))
+                );
+                alert('Some queued sales were rejected and kept on this terminal for review:\n' + rejected.map(r => r.detail).join('\n'));
+            }
+            if (batch.length < SYNC_BATCH_SIZE) break;
+        }
+    } catch (error) {
+        // Offline or server unreachable: the sales stay queued
+        console.warn('Sales sync postponed:', error);
+    } finally {
+        syncInFlight = false;
+    }
 }
 
 async function viewSale(id) {
@@ -651,9 +955,14 @@ async function viewSale(id) {
 
 // Cash Flow
 async function loadCashFlow() {
-    const cashflows = await apiCall('/cashflow');
-    if (!cashflows) return;
-    
+    await getTable('cashflow');
+    if (!tables.cashflow) return;  // Load failed or was discarded by a reset
+    renderCashFlow();
+}
+
+function renderCashFlow() {
+    if (!tables.cashflow) return;
+    const cashflows = Array.from(tables.cashflow.values());
     const tbody = document.getElementById('cashFlowTableBody');
     tbody.innerHTML = cashflows.map(c => `
         <tr>
@@ -691,19 +1000,14 @@ async function handleCashFlowSubmit(e) {
         description: document.getElementById('cashFlowDescription').value
     };
     
-    if (id) {
-        await apiCall(`/cashflow/${id}`, 'PUT', data);
-    } else {
-        await apiCall('/cashflow', 'POST', data);
-    }
+    const saved = id ? await apiCall(`/cashflow/${id}`, 'PUT', data) : await apiCall('/cashflow', 'POST', data);
     
     closeCashFlowModal();
-    loadCashFlow();
+    upsertRow('cashflow', saved);
 }
 
 async function editCashFlow(id) {
-    const cashflows = await apiCall(`/cashflow`);
-    const c = cashflows.find(c => c.id === id);
+    const c = getRow('cashflow', id);
     if (c) {
         document.getElementById('cashFlowId').value = c.id;
         document.getElementById('cashFlowDate').value = c.transaction_date;
@@ -716,15 +1020,13 @@ async function editCashFlow(id) {
 
 async function deleteCashFlow(id) {
     if (confirm('Are you sure you want to delete this transaction?')) {
-        await apiCall(`/cashflow/${id}`, 'DELETE');
-        loadCashFlow();
+        if (await apiCall(`/cashflow/${id}`, 'DELETE')) deleteRow('cashflow', id);
     }
 }
 
 // Reports
 async function loadReports() {
-    const items = await apiCall('/items');
-    if (!items) return;
+    const items = await getTable('items');
     
     const select = document.getElementById('reportItemSelect');
     select.innerHTML = '<option value="">All Items</option>' + 
@@ -751,3 +1053,43 @@ async function generateInventoryReport() {
     `).join('');
 }
 
+// Large exports run as background report jobs; poll until the CSV is ready
+async function exportInventoryReport() {
+    const button = document.getElementById('exportLedgerBtn');
+    const itemId = document.getElementById('reportItemSelect').value;
+    const body = { kind: 'inventory_ledger' };
+    if (itemId) body.item_id = parseInt(itemId);
+
+    let job = await apiCall('/jobs/reports', 'POST', body);
+    if (!job) return;
+    button.disabled = true;
+    button.textContent = 'Preparing...';
+    try {
+        while (job && (job.status === 'queued' || job.status === 'running')) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            job = await apiCall(`/jobs/${job.id}`);
+        }
+        if (!job) return;
+        if (job.status === 'failed') {
+            alert(`Export failed: ${job.error}`);
+            return;
+        }
+        const response = await fetch(`${API_BASE}/jobs/${job.id}/download`, {
+            headers: { 'Authorization': `Bearer ${authToken}` }
+        });
+        if (!response.ok) {
+            alert('Could not download the report');
+            return;
+        }
+        const url = URL.createObjectURL(await response.blob());
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = `inventory-ledger-${job.id}.csv`;
+        link.click();
+        URL.revokeObjectURL(url);
+    } finally {
+        button.disabled = false;
+        button.textContent = 'Export CSV';
+    }
+}
+
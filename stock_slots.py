@@ -0,0 +1,151 @@
+import os
+import random
+import threading
+import time
+from typing import Iterable, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Item, ItemStockSlot
+from schemas import ItemResponse
+
+# Split stock counters for hot items.
+#
+# A sharded item keeps its stock in N item_stock_slots rows. A sale takes the
+# whole quantity from one random slot with a conditional UPDATE, so concurrent
+# tills lock different rows instead of queueing on items.current_stock. The
+# stock of a sharded item is the SUM of its slots; compaction periodically
+# rebalances the slots and writes that sum back to items.current_stock.
+
+STOCK_COMPACTION_INTERVAL = float(os.getenv("STOCK_COMPACTION_INTERVAL", "30"))
+MAX_STOCK_SLOTS = 64
+
+def _split(total: float, slots: int) -> List[float]:
+    share = total / slots
+    quantities = [share] * slots
+    # Put the rounding remainder in the first slot so the sum is exact
+    quantities[0] = total - share * (slots - 1)
+    return quantities
+
+def get_slots(db: Session, item_id: int, lock: bool = False):
+    # populate_existing: slots are also changed by bulk UPDATEs the session does not track
+    query = db.query(ItemStockSlot).filter(ItemStockSlot.item_id == item_id) \
+        .order_by(ItemStockSlot.slot).populate_existing()
+    if lock:
+        query = query.with_for_update()
+    return query.all()
+
+def stock_levels(db: Session, item_ids: Optional[Iterable[int]] = None) -> dict:
+    """SUM of slots for sharded items; unsharded items are not in the result"""
+    query = db.query(ItemStockSlot.item_id, func.sum(ItemStockSlot.quantity))
+    if item_ids is not None:
+        query = query.filter(ItemStockSlot.item_id.in_(list(item_ids)))
+    return {item_id: total or 0.0 for item_id, total in query.group_by(ItemStockSlot.item_id).all()}
+
+def item_responses(db: Session, items: List[Item]) -> List[ItemResponse]:
+    """ItemResponse rows with current_stock read from the slots of sharded items"""
+    levels = stock_levels(db, [item.id for item in items]) if items else {}
+    responses = []
+    for item in items:
+        response = ItemResponse.model_validate(item)
+        if item.id in levels:
+            response = response.model_copy(update={"current_stock": levels[item.id]})
+        responses.append(response)
+    return responses
+
+def shard_item(db: Session, item: Item, slots: int):
+    """Spread the item's stock over slots rows; slots=0 folds it back into items.current_stock"""
+    existing = get_slots(db, item.id, lock=True)
+    total = sum(s.quantity for s in existing) if existing else (item.current_stock or 0.0)
+    for s in existing:
+        db.delete(s)
+    db.flush()
+    if slots > 0:
+        for slot, quantity in enumerate(_split(total, slots)):
+            db.add(ItemStockSlot(item_id=item.id, slot=slot, quantity=quantity))
+    item.current_stock = total
+
+def set_stock(db: Session, item: Item, total: float):
+    """Overwrite the stock of a sharded item, keeping its slot count"""
+    existing = get_slots(db, item.id, lock=True)
+    for s, quantity in zip(existing, _split(total, len(existing))):
+        s.quantity = quantity
+    item.current_stock = total
+
+def take_stock(db: Session, item_id: int, quantity: float, slots) -> bool:
+    """Take quantity from a sharded item's slots; False when the stock is insufficient"""
+    candidates = [s.slot for s in slots if s.quantity >= quantity]
+    random.shuffle(candidates)
+    for slot in candidates:
+        updated = db.query(ItemStockSlot).filter(
+            ItemStockSlot.item_id == item_id,
+            ItemStockSlot.slot == slot,
+            ItemStockSlot.quantity >= quantity
+        ).update({ItemStockSlot.quantity: ItemStockSlot.quantity - quantity}, synchronize_session=False)
+        if updated:
+            return True
+
+    # No single slot is big enough: lock all of them (in slot order) and drain greedily
+    locked = get_slots(db, item_id, lock=True)
+    if sum(s.quantity for s in locked) < quantity:
+        return False
+    remaining = quantity
+    for s in sorted(locked, key=lambda s: -s.quantity):
+        taken = min(s.quantity, remaining)
+        s.quantity -= taken
+        remaining -= taken
+        if remaining <= 0:
+            break
+    db.flush()
+    return True
+
+def add_stock(db: Session, item_id: int, quantity: float, slots):
+    slot = random.choice(slots).slot
+    db.query(ItemStockSlot).filter(
+        ItemStockSlot.item_id == item_id,
+        ItemStockSlot.slot == slot
+    ).update({ItemStockSlot.quantity: ItemStockSlot.quantity + quantity}, synchronize_session=False)
+
+def compact_stock_slots(db: Session) -> int:
+    """Rebalance the slots of every sharded item and write their sum to items.current_stock"""
+    item_ids = [row[0] for row in db.query(ItemStockSlot.item_id).distinct().all()]
+    for item_id in item_ids:
+        # One short transaction per item keeps the slot locks brief
+        slots = get_slots(db, item_id, lock=True)
+        total = sum(s.quantity for s in slots)
+        for s, quantity in zip(slots, _split(total, len(slots))):
+            s.quantity = quantity
+        db.query(Item).filter(Item.id == item_id).update({Item.current_stock: total}, synchronize_session=False)
+        db.commit()
+    return len(item_ids)
+
+def start_compaction(session_factory):
+    """Run compact_stock_slots every STOCK_COMPACTION_INTERVAL seconds in a daemon thread"""
+    if STOCK_COMPACTION_INTERVAL <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(STOCK_COMPACTION_INTERVAL)
+            db = session_factory()
+            try:
+                compact_stock_slots(db)
+            except Exception as e:
+                db.rollback()
+                print(f"❌ Stock slot compaction failed: {str(e)}")
+            finally:
+                db.close()
+
+    thread = threading.Thread(target=run, name="stock-slot-compaction", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine, Base
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(f"Compacted {compact_stock_slots(db)} sharded items")
+    finally:
+        db.close()
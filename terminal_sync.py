@@ -0,0 +1,140 @@
+from collections import defaultdict
+from sqlalchemy.orm import Session
+
+from models import Item, Customer, SalesMaster, SalesDetail, ItemLedger, CashFlow, SyncedSale, MovementType, CashFlowType
+from schemas import SalesSyncRequest, SalesMasterResponse, CashFlowResponse
+from stock_slots import stock_levels, get_slots, take_stock
+from statements import invalidate_checkpoints
+
+# Batched upload of sales queued by terminals while they were offline.
+#
+# A batch is applied in one transaction: the stock rows of every item in the
+# batch are locked once, each sale is checked against the running stock in
+# memory, and the accepted sales are written together with a single stock
+# update per item. Sales are identified by a client-generated id, so a batch
+# that is retried after a lost response is not applied twice.
+
+MAX_SYNC_BATCH = 500
+
+def _demand(sale) -> dict:
+    demand = defaultdict(float)
+    for detail in sale.details:
+        demand[detail.item_id] += detail.quantity
+    return demand
+
+def apply_sales_batch(db: Session, batch: SalesSyncRequest, username: str) -> dict:
+    """Apply a batch of queued sales; returns per-sale results and the rows to broadcast"""
+    client_ids = [sale.client_id for sale in batch.sales]
+    item_ids = sorted({detail.item_id for sale in batch.sales for detail in sale.details})
+    customer_ids = {sale.customer_id for sale in batch.sales}
+
+    # Lock the stock of the whole batch up front, always in item id order.
+    # Sharded items lock their slots rather than the shared items row.
+    sharded = set(stock_levels(db, item_ids)) if item_ids else set()
+    items, slots, available = {}, {}, {}
+    for item in db.query(Item).filter(Item.id.in_(item_ids)).order_by(Item.id).all():
+        items[item.id] = item
+    plain_ids = [item_id for item_id in items if item_id not in sharded]
+    if plain_ids:
+        for item in db.query(Item).filter(Item.id.in_(plain_ids)).order_by(Item.id) \
+                .with_for_update().populate_existing().all():
+            available[item.id] = item.current_stock or 0.0
+    for item_id in sorted(sharded):
+        slots[item_id] = get_slots(db, item_id, lock=True)
+        available[item_id] = sum(s.quantity for s in slots[item_id])
+
+    # Locking read so a batch retried concurrently sees the first one's ids
+    existing = dict(db.query(SyncedSale.client_id, SyncedSale.sales_id)
+                    .filter(SyncedSale.client_id.in_(client_ids)).with_for_update().all())
+    known_customers = {row[0] for row in db.query(Customer.id).filter(Customer.id.in_(customer_ids)).all()}
+
+    results, accepted, seen = [], [], set()
+    for sale in batch.sales:
+        if sale.client_id in existing:
+            results.append({"client_id": sale.client_id, "status": "duplicate", "sales_id": existing[sale.client_id]})
+            continue
+        if sale.client_id in seen:
+            results.append({"client_id": sale.client_id, "status": "duplicate", "detail": "Repeated in batch"})
+            continue
+        seen.add(sale.client_id)
+
+        reason = None
+        demand = _demand(sale)
+        if not sale.details:
+            reason = "Sale has no items"
+        elif sale.customer_id not in known_customers:
+            reason = f"Customer {sale.customer_id} not found"
+        else:
+            for item_id, quantity in demand.items():
+                if item_id not in items:
+                    reason = f"Item {item_id} not found"
+                    break
+                if available[item_id] < quantity:
+                    reason = f"Insufficient stock for item {items[item_id].name}. Available: {available[item_id]}"
+                    break
+        if reason:
+            results.append({"client_id": sale.client_id, "status": "rejected", "detail": reason})
+            continue
+
+        for item_id, quantity in demand.items():
+            available[item_id] -= quantity
+        result = {"client_id": sale.client_id, "status": "accepted"}
+        results.append(result)
+        accepted.append((sale, result))
+
+    if not accepted:
+        db.rollback()
+        return {"results": results, "sales": [], "cashflows": [], "item_ids": []}
+
+    masters = []
+    for sale, _ in accepted:
+        masters.append(SalesMaster(
+            sales_date=sale.sales_date,
+            customer_id=sale.customer_id,
+            created_by=username,
+            total_amount=sum(d.quantity * d.rate for d in sale.details)
+        ))
+    db.add_all(masters)
+    db.flush()
+    for customer_id, sales_date in {(sale.customer_id, sale.sales_date) for sale, _ in accepted}:
+        invalidate_checkpoints(db, "customer", customer_id, sales_date)
+
+    cashflows = []
+    total_demand = defaultdict(float)
+    for (sale, result), master in zip(accepted, masters):
+        for detail in sale.details:
+            db.add(SalesDetail(sales_id=master.id, item_id=detail.item_id, quantity=detail.quantity, rate=detail.rate))
+            db.add(ItemLedger(
+                item_id=detail.item_id,
+                movement_date=sale.sales_date,
+                movement_type=MovementType.OUT,
+                quantity=detail.quantity,
+                movement_reference=f"SALES-{master.id}"
+            ))
+            total_demand[detail.item_id] += detail.quantity
+        cashflow = CashFlow(
+            transaction_date=sale.sales_date,
+            type=CashFlowType.IN,
+            amount=master.total_amount,
+            description=f"Sale to Customer - Sales #{master.id}",
+            ref_id=f"SALES-{master.id}"
+        )
+        db.add(cashflow)
+        cashflows.append(cashflow)
+        db.add(SyncedSale(client_id=sale.client_id, sales_id=master.id, terminal_id=batch.terminal_id))
+        result["sales_id"] = master.id
+
+    # One stock update per item for the whole batch
+    for item_id, quantity in total_demand.items():
+        if item_id in sharded:
+            take_stock(db, item_id, quantity, slots[item_id])
+        else:
+            items[item_id].current_stock -= quantity
+    db.flush()
+
+    sales = [SalesMasterResponse.model_validate(master) for master in masters]
+    for (_, result), response in zip(accepted, sales):
+        result["sale"] = response
+    cashflows = [CashFlowResponse.model_validate(cashflow) for cashflow in cashflows]
+    db.commit()
+    return {"results": results, "sales": sales, "cashflows": cashflows, "item_ids": list(total_demand)}